@@ -0,0 +1,147 @@
+import json
+import sqlite3
+import threading
+import zlib
+
+from tep_decoder import loads
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Первый байт сжатого блоба - метка алгоритма, чтобы архив читался и без zstandard, если он писался через zlib
+_ZSTD = b'z'
+_ZLIB = b'd'
+
+
+class RawArchive:
+    """
+    Архив сырых ответов API в SQLite: страницы docsSearch, brief документов и карточки дел.
+    Ответы хранятся как есть, сжатыми zstd (если установлен zstandard) или zlib,
+    и позволяют пересобрать выгрузку (reextract.py) без повторных запросов к сайту.
+    Строки поиска хранятся отдельно по id документа в порядке получения.
+    """
+
+    def __init__(self, path, readonly=False, commit_every=200):
+        """
+        :param path: путь к файлу SQLite
+        :param readonly: открыть только для чтения (для процессов reextract.py)
+        :param commit_every: через сколько операций записи сохранять изменения в базу
+        """
+        self.commit_every = commit_every
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        if zstandard is not None:
+            self._compressor = zstandard.ZstdCompressor(level=3)
+            self._decompressor = zstandard.ZstdDecompressor()
+        else:
+            self._compressor = self._decompressor = None
+        if readonly:
+            self._db = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+            return
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS search_pages '
+            '(id INTEGER PRIMARY KEY, type TEXT, request TEXT, page INTEGER, body BLOB)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS search_rows '
+            '(seq INTEGER PRIMARY KEY, doc_id TEXT UNIQUE, type TEXT, body BLOB)'
+        )
+        self._db.execute('CREATE TABLE IF NOT EXISTS briefs (doc_id TEXT PRIMARY KEY, body BLOB)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS cards (case_number TEXT PRIMARY KEY, status INTEGER, body BLOB)'
+        )
+        self._db.commit()
+
+    def _compress(self, data):
+        if self._compressor is not None:
+            return _ZSTD + self._compressor.compress(data)
+        return _ZLIB + zlib.compress(data, 6)
+
+    def _decompress(self, blob):
+        blob = bytes(blob)
+        if blob[:1] == _ZSTD:
+            if self._decompressor is None:
+                raise Exception('Архив сжат zstd, установите пакет zstandard')
+            return self._decompressor.decompress(blob[1:])
+        return zlib.decompress(blob[1:])
+
+    def _write(self, sql, rows):
+        with self._lock:
+            self._db.executemany(sql, rows)
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self._db.commit()
+                self._uncommitted = 0
+
+    def add_search_page(self, type_, request, page, content, rows):
+        """
+        Сохраняет страницу docsSearch и строки поиска из нее
+        :param content: тело ответа (bytes)
+        :param rows: разобранный список data из ответа
+        """
+        self._write('INSERT INTO search_pages (type, request, page, body) VALUES (?, ?, ?, ?)',
+                    [(type_, request, page, self._compress(content))])
+        # Строка поиска документа заменяется более новой, но сохраняет место в порядке первого получения
+        self._write(
+            'INSERT INTO search_rows (doc_id, type, body) VALUES (?, ?, ?) '
+            'ON CONFLICT(doc_id) DO UPDATE SET type = excluded.type, body = excluded.body',
+            [(str(row['id']), type_, self._compress(json.dumps(row, ensure_ascii=False).encode('utf-8')))
+             for row in rows]
+        )
+
+    def add_brief(self, doc_id, content):
+        self._write('INSERT OR REPLACE INTO briefs (doc_id, body) VALUES (?, ?)',
+                    [(str(doc_id), self._compress(content))])
+
+    def add_card(self, case_number, status, content):
+        self._write('INSERT OR REPLACE INTO cards (case_number, status, body) VALUES (?, ?, ?)',
+                    [(str(case_number), status, self._compress(content))])
+
+    def get_brief(self, doc_id):
+        """ Возвращает разобранный brief документа или None, если его нет в архиве """
+        with self._lock:
+            row = self._db.execute('SELECT body FROM briefs WHERE doc_id = ?', (str(doc_id),)).fetchone()
+        return loads(self._decompress(row[0])) if row else None
+
+    def get_card(self, case_number):
+        """ Возвращает пару (статус ответа, разобранная карточка или None) либо None, если карточки нет в архиве """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT status, body FROM cards WHERE case_number = ?', (str(case_number),)
+            ).fetchone()
+        if row is None:
+            return None
+        status, body = row
+        return status, (loads(self._decompress(body)) if status < 400 else None)
+
+    def get_doc_ids(self, type_=None):
+        """ id документов в порядке получения, по всем типам или только по type_ """
+        with self._lock:
+            if type_:
+                rows = self._db.execute('SELECT doc_id FROM search_rows WHERE type = ? ORDER BY seq',
+                                        (type_,)).fetchall()
+            else:
+                rows = self._db.execute('SELECT doc_id FROM search_rows ORDER BY seq').fetchall()
+        return [row[0] for row in rows]
+
+    def get_search_rows(self, doc_ids):
+        """ Строки поиска документов в порядке doc_ids """
+        with self._lock:
+            rows = dict(self._db.execute(
+                f'SELECT doc_id, body FROM search_rows WHERE doc_id IN ({",".join("?" * len(doc_ids))})',
+                list(doc_ids)
+            ).fetchall())
+        return [loads(self._decompress(rows[doc_id])) for doc_id in doc_ids if doc_id in rows]
+
+    def commit(self):
+        with self._lock:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self._db.close()
@@ -0,0 +1,62 @@
+"""
+Сравнение дедупликации записей: поиск в списке (как было в save_js_obj) и Deduplicator.
+Запуск: python benchmarks/bench_dedup.py [кол-во записей ...]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import Deduplicator  # noqa: E402
+
+
+def make_records(n):
+    return [
+        {
+            'region': 'moscow',
+            'date': '2023-01-01T00:00:00Z',
+            'number': f'RU77-{i:06d}',
+            'zastroychik': f'ООО Застройщик {i % 500}',
+            'cad_numbers': [f'77:01:0001001:{i}'],
+            'teps': {'Площадь участка': str(i), 'Этажность': str(i % 30)},
+            'url': f'https://gisogd.mos.ru/document/{i}',
+        }
+        for i in range(n)
+    ]
+
+
+def bench_list(records, limit_seconds=60):
+    loaded = []
+    start = time.perf_counter()
+    for i, record in enumerate(records):
+        if record not in loaded:
+            loaded.append(record)
+        if time.perf_counter() - start > limit_seconds:
+            return None, i
+    return time.perf_counter() - start, len(records)
+
+
+def bench_dedup(records, key):
+    dedup = Deduplicator(key)
+    start = time.perf_counter()
+    for record in records:
+        dedup.add(record)
+    return time.perf_counter() - start
+
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [10_000, 100_000]
+    for n in sizes:
+        records = make_records(n)
+        list_time, done = bench_list(records)
+        if list_time is None:
+            list_res = f'> 60 с (обработано {done})'
+        else:
+            list_res = f'{list_time:.3f} с'
+        print(f'{n} записей: list {list_res}, '
+              f'content {bench_dedup(records, "content"):.3f} с, url {bench_dedup(records, "url"):.3f} с')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Разбор customAttributes одного документа: прежние четыре цикла из extract_data и tep_decoder.
+Проверяет, что результат совпадает, и печатает время на документ.
+Запуск: python benchmarks/bench_tep_decoder.py [кол-во повторов]
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tep_decoder  # noqa: E402
+
+
+def legacy_decode(custom_attributes):
+    """ Разбор customAttributes в том виде, как он был в extract_data """
+    result = {}
+    custom_attr = json.loads(custom_attributes)
+    other_details = {}
+    for attr in custom_attr:
+        if 'tepList' in attr['code']:
+            tep_dict = {}
+            attr_dict = json.loads(attr['value'])
+            for element in attr_dict:
+                if len(element) == 2:
+                    name, value = element
+                else:
+                    continue
+                if 'tepListTepName' in name:
+                    tep_dict[value['value']] = name['value']
+                else:
+                    tep_dict[name['value']] = value['value']
+            result['teps'] = tep_dict
+        elif 'dopTepList' in attr['code']:
+            tep_dict = {}
+            attr_dict = json.loads(attr['value'])
+            for element in attr_dict:
+                if len(element) == 2:
+                    name, value = element
+                else:
+                    continue
+                if 'tepListTepName' in name:
+                    tep_dict[value['value']] = name['value']
+                else:
+                    tep_dict[name['value']] = value['value']
+            result['additional_teps'] = tep_dict
+        elif 'tepGroups' in attr['code']:
+            tep_groups = {}
+            attr_dict = json.loads(attr['value'])
+            for group in attr_dict:
+                for det in group:
+                    if 'tepGroupsGroupName' in det['code']:
+                        name_tepgroup = det['value']
+                    else:
+                        group_det = {}
+                        attr_list = json.loads(det['value'])
+                        for tep in attr_list:
+                            name, value = tep
+                            if 'tepGroupsTepListTepValue' in name:
+                                group_det[value['value']] = name['value']
+                            else:
+                                group_det[name['value']] = value['value']
+                        tep_groups[name_tepgroup] = group_det
+            result['tep_groups'] = tep_groups
+        elif 'dopTepGroups' in attr['code']:
+            tep_groups = {}
+            attr_dict = json.loads(attr['value'])
+            for group in attr_dict:
+                for det in group:
+                    if 'dopTepGroupsGroupName' in det['code']:
+                        name_tepgroup = det['value']
+                    else:
+                        group_det = {}
+                        attr_list = json.loads(det['value'])
+                        for tep in attr_list:
+                            name, value = tep
+                            if 'dopTepGroupsTepListTepName' in name:
+                                group_det[value['value']] = name['value']
+                            else:
+                                group_det[name['value']] = value['value']
+                        tep_groups[name_tepgroup] = group_det
+            result['additional_teps_groups'] = tep_groups
+        else:
+            other_details[attr['name']] = attr['value']
+    return result, other_details
+
+
+def _pairs(prefix, n):
+    return [
+        [{'code': f'{prefix}TepName', 'value': f'Показатель {i}'}, {'code': f'{prefix}TepValue', 'value': str(i * 1.5)}]
+        for i in range(n)
+    ]
+
+
+def make_custom_attributes(teps=30, groups=5):
+    """ Синтетический customAttributes, похожий по структуре на ответ brief """
+    attrs = [{'code': f'attr{i}', 'name': f'Атрибут {i}', 'value': f'Значение {i}'} for i in range(20)]
+    attrs.append({'code': 'tepList', 'name': 'ТЭП', 'value': json.dumps(_pairs('tepList', teps))})
+    attrs.append({'code': 'dopTepList', 'name': 'Доп. ТЭП', 'value': json.dumps(_pairs('dopTepList', teps))})
+    for code in ('tepGroups', 'dopTepGroups'):
+        value = [
+            [
+                {'code': f'{code}GroupName', 'value': f'Группа {g}'},
+                {'code': f'{code}TepList', 'value': json.dumps(_pairs(f'{code}TepList', teps // 2))},
+            ]
+            for g in range(groups)
+        ]
+        attrs.append({'code': code, 'name': code, 'value': json.dumps(value)})
+    return json.dumps(attrs)
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    raw = make_custom_attributes()
+    assert tep_decoder.decode_custom_attributes(raw) == legacy_decode(raw), 'результаты разбора отличаются'
+
+    legacy = timeit.timeit(lambda: legacy_decode(raw), number=number) / number
+    print(f'прежний разбор (json): {legacy * 1e6:.1f} мкс/документ')
+    fast = timeit.timeit(lambda: tep_decoder.decode_custom_attributes(raw), number=number) / number
+    print(f'tep_decoder ({tep_decoder.JSON_BACKEND}): {fast * 1e6:.1f} мкс/документ, x{legacy / fast:.2f}')
+    if tep_decoder.JSON_BACKEND != 'json':
+        tep_decoder.loads = json.loads
+        stdlib = timeit.timeit(lambda: tep_decoder.decode_custom_attributes(raw), number=number) / number
+        print(f'tep_decoder (json): {stdlib * 1e6:.1f} мкс/документ, x{legacy / stdlib:.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Бенчмарк get_objects + extract_data против локального стенда (benchmarks/stand_server.py), без сети и браузера.
+Для каждого размера запускает стенд и парсер в отдельных процессах и печатает документы в секунду,
+p50/p99 задержки по каждому endpoint и пиковый RSS процесса парсера.
+
+Запуск: python benchmarks/run_bench.py --docs 1000 10000 100000 --latency 0.02 --error-rate 0.01
+Переменные ARG_* (ARG_CONCURRENCY, ARG_SHARD и т.п.) передаются парсеру как есть.
+"""
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def endpoint_name(url):
+    if url.endswith('/docsSearch'):
+        return 'docsSearch'
+    if url.endswith('/brief'):
+        return 'brief'
+    if url.endswith('/card'):
+        return 'card'
+    return 'other'
+
+
+def run_worker():
+    """ Выполняется в процессе парсера: переменные ARG_* уже выставлены родителем """
+    sys.path.insert(0, ROOT_DIR)
+    sys.path.insert(0, BENCH_DIR)
+    import parser
+    from stand_server import FAKE_COOKIES
+
+    # Вход через браузер заменяется выдачей cookies, которые принимает стенд
+    parser.get_cookies = lambda email, password, proxy_: FAKE_COOKIES
+
+    latencies = {}
+    send_request = parser.send_request
+
+    def timed_send_request(method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            return send_request(method, url, **kwargs)
+        finally:
+            latencies.setdefault(endpoint_name(url), []).append(time.perf_counter() - start)
+
+    parser.send_request = timed_send_request
+
+    start = time.perf_counter()
+    parser.parse()
+    elapsed = time.perf_counter() - start
+
+    docs = len(parser.deduplicator)
+    result = {
+        'docs': docs,
+        'seconds': round(elapsed, 3),
+        'docs_per_second': round(docs / elapsed, 1) if elapsed else None,
+        # ru_maxrss в Linux - в килобайтах
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'endpoints': {
+            name: {
+                'requests': len(values),
+                'p50_ms': round(percentile(values, 50) * 1000, 2),
+                'p99_ms': round(percentile(values, 99) * 1000, 2),
+            }
+            for name, values in sorted(latencies.items())
+        },
+        'case_cache': parser.case_cache.stats(),
+    }
+    print(json.dumps(result), file=sys.__stdout__, flush=True)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1)
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise Exception(f'Стенд не запустился на порту {port}')
+
+
+def run_size(docs, args):
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, 'stand_server.py'), '--docs', str(docs), '--port', str(port),
+        '--latency', str(args.latency), '--error-rate', str(args.error_rate),
+        '--unauthorized-rate', str(args.unauthorized_rate),
+    ], stdout=subprocess.DEVNULL)
+    try:
+        wait_for_server(port)
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ)
+            env.setdefault('ARG_TYPE', 'RNS')
+            env.setdefault('ARG_DATE_FROM', '2019-12-31')
+            env.setdefault('ARG_OUTPUT_FORMAT', 'ndjson')
+            env.setdefault('ARG_RETRY_BASE_DELAY', '0.05')
+            env.update({
+                'ARG_API_URL': f'http://127.0.0.1:{port}/isogd/front/api',
+                'ARG_OUTPUT': os.devnull,
+                'ARG_COOKIES_FILE': os.path.join(tmp, 'cookies.json'),
+                'ARG_PROXY': '',
+            })
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker'], env=env,
+                                    stdout=subprocess.PIPE, check=True, text=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--latency', type=float, default=0.01, help='средняя задержка ответа стенда, секунды')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 504')
+    parser.add_argument('--unauthorized-rate', type=float, default=0.0, help='доля ответов 401')
+    parser.add_argument('--json', action='store_true', help='печатать результаты в JSON')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker()
+        return
+
+    for docs in args.docs:
+        result = run_size(docs, args)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+            continue
+        print(f'{docs} документов: {result["docs_per_second"]} док/с за {result["seconds"]} с, '
+              f'пиковый RSS {result["peak_rss_mb"]} МБ')
+        for name, stats in result['endpoints'].items():
+            print(f'  {name:<10} запросов {stats["requests"]:>7}  p50 {stats["p50_ms"]:>8} мс  p99 {stats["p99_ms"]:>8} мс')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Локальный стенд API gisogd.mos.ru для бенчмарков без сети.
+Отдает синтетические, но похожие по структуре ответы docsSearch, documents/{id}/brief и office-cases/{n}/card
+с заданной задержкой и долей ответов 504 и 401.
+
+Запуск: python benchmarks/stand_server.py --docs 10000 --port 8900 --latency 0.02 --error-rate 0.01
+Парсер: ARG_API_URL=http://127.0.0.1:8900/isogd/front/api python parser.py
+Авторизованным считается запрос с cookie bench_session=ok (см. FAKE_COOKIES).
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import re
+import socket
+import sys
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_tep_decoder import make_custom_attributes  # noqa: E402
+
+API_PREFIX = '/isogd/front/api'
+FIRST_DATE = date(2020, 1, 1)
+# Cookies, которые стенд считает действующими, в формате selenium
+FAKE_COOKIES = [{'name': 'bench_session', 'value': 'ok', 'domain': '127.0.0.1', 'path': '/', 'secure': False}]
+
+DATE_RANGE_RE = re.compile(r'dateOfDocument:\[(\S+)T00:00:00\.000Z TO (\*|(\S+)T00:00:00\.000Z)[\]}]')
+BRIEF_RE = re.compile(rf'^{API_PREFIX}/gisogd/documents/([^/]+)/brief$')
+CARD_RE = re.compile(rf'^{API_PREFIX}/gisogd/office-cases/([^/]+)/card$')
+
+
+class Dataset:
+    """ Синтетический набор документов. Документы упорядочены по дате, дата растет с номером документа """
+
+    def __init__(self, docs, days=1500, seed=0):
+        self.docs = docs
+        self.case_count = max(10, docs // 5)
+        self.dates = [(FIRST_DATE + timedelta(days=i * days // max(docs, 1))).isoformat() for i in range(docs)]
+        self.custom_attributes = [make_custom_attributes(teps=10 + 10 * v, groups=2 + v) for v in range(3)]
+        self.seed = seed
+
+    def search_row(self, i):
+        row = {
+            'id': f'doc-{i}',
+            'dateOfDocument': f'{self.dates[i]}T00:00:00Z',
+            'dateOfRegistration': f'{self.dates[i]}T00:00:00Z',
+            'officialDocumentNumber': f'RU77-{i:07d}',
+            'address': f'г. Москва, ул. Тестовая, д. {i % 300}',
+        }
+        if i % 4:
+            row['cadastralNumbers'] = [f'77:01:{i % 9999:07d}:{i}']
+        return row
+
+    def search(self, date_from, date_to, page, size):
+        lo = bisect.bisect_left(self.dates, date_from)
+        hi = bisect.bisect_left(self.dates, date_to) if date_to else self.docs
+        start = lo + page * size
+        rows = [self.search_row(i) for i in range(start, min(start + size, hi))]
+        return {'data': rows, 'pagination': {'total': max(hi - lo, 0)}}
+
+    def brief(self, doc_id):
+        i = int(doc_id.split('-')[1])
+        rnd = random.Random(self.seed * 1000003 + i)
+        cad_links = [
+            {'cadastralNumber': f'77:01:{i % 9999:07d}:{k}', 'caseNumber': str(rnd.randrange(self.case_count))}
+            for k in range(rnd.randint(1, 3))
+        ]
+        return {
+            'customAttributes': self.custom_attributes[i % len(self.custom_attributes)],
+            'dataObjects': [{
+                'name': f'Объект {i}',
+                'destination': 'Жилое здание',
+                'terrains': [{'cadastralNumbers': cad_links}],
+            }],
+        }
+
+    def card(self, case_number):
+        n = int(case_number)
+        if n % 10 == 0:
+            return {}
+        return {'officeCase': {'organisationName': f'ООО Застройщик {n % 500}'}}
+
+
+def make_handler(dataset, latency, error_rate, unauthorized_rate):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            # Заголовки и тело пишутся отдельно, без TCP_NODELAY каждый ответ ждет delayed ACK клиента
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def _reply(self, status, payload=None):
+            body = json.dumps(payload if payload is not None else {}, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _simulate(self):
+            """ Задержка и случайные ошибки. Возвращает True, если ответ уже отправлен """
+            if latency:
+                time.sleep(latency * random.uniform(0.5, 1.5))
+            if 'bench_session=ok' not in (self.headers.get('Cookie') or ''):
+                self._reply(401)
+                return True
+            if unauthorized_rate and random.random() < unauthorized_rate:
+                self._reply(401)
+                return True
+            if error_rate and random.random() < error_rate:
+                self._reply(504)
+                return True
+            return False
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if self.path != f'{API_PREFIX}/solr/docsSearch':
+                self._reply(404)
+                return
+            if self._simulate():
+                return
+            payload = json.loads(body)
+            match = DATE_RANGE_RE.search(payload.get('request', ''))
+            date_from, date_to = (match.group(1), match.group(3)) if match else ('0000-00-00', None)
+            pagination = payload['pagination']
+            self._reply(200, dataset.search(date_from, date_to, pagination['page'], pagination['size']))
+
+        def do_GET(self):
+            brief = BRIEF_RE.match(self.path)
+            card = CARD_RE.match(self.path)
+            if not brief and not card:
+                self._reply(404)
+                return
+            if self._simulate():
+                return
+            if brief:
+                self._reply(200, dataset.brief(brief.group(1)))
+            else:
+                self._reply(200, dataset.card(card.group(1)))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=1000, help='число документов в поиске')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0, help='средняя задержка ответа, секунды')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 504')
+    parser.add_argument('--unauthorized-rate', type=float, default=0.0, help='доля ответов 401')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(
+        Dataset(args.docs), args.latency, args.error_rate, args.unauthorized_rate))
+    server.daemon_threads = True
+    print(f'stand: {args.docs} документов на http://{args.host}:{args.port}{API_PREFIX}', flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Обратный индекс: кадастровый номер и номер дела -> документы и застройщик.
+Застройщик по кадастровому номеру - застройщик документов (поле zastroychik), по номеру дела - organisationName
+из карточки самого дела. Пополняется по мере выгрузки (ARG_CAD_INDEX) и хранится в SQLite, поиск по ключу - один проход по B-дереву.
+
+Запрос: python cad_index.py index.db cad 77:01:0001001:1
+        python cad_index.py index.db case 12345
+"""
+import argparse
+import json
+import sqlite3
+
+from sqlite_sink import doc_id_from_url
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS postings (kind TEXT, key TEXT, doc_id TEXT, PRIMARY KEY (kind, key, doc_id)) '
+    'WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS postings_doc_id ON postings (doc_id)',
+    'CREATE TABLE IF NOT EXISTS documents '
+    '(doc_id TEXT PRIMARY KEY, type TEXT, number TEXT, date TEXT, zastroychik TEXT, url TEXT)',
+    'CREATE TABLE IF NOT EXISTS cases (case_number TEXT PRIMARY KEY, organisation_name TEXT)',
+)
+
+CAD = 'cad'
+CASE = 'case'
+
+
+def record_keys(record):
+    """ Ключи индекса записи: (CAD, кадастровый номер) и (CASE, номер дела из cad_links) """
+    keys = {(CAD, cad_number) for cad_number in record['cad_numbers'] or ()}
+    keys.update((CASE, link.rsplit('/', 1)[-1]) for link in record['cad_links'] or ())
+    return keys
+
+
+class CadIndexWriter:
+    """ Добавляет записи одного типа документов в индекс пачками по batch_size. Неполная пачка пишется только в close() """
+
+    def __init__(self, path, doc_type, batch_size=1000, get_organisation_name=None):
+        """
+        :param get_organisation_name: функция номер дела -> organisationName или None (parser.get_organisation_name).
+            Если не задана, застройщики дел не сохраняются
+        """
+        self.doc_type = doc_type
+        self.batch_size = batch_size
+        self.get_organisation_name = get_organisation_name
+        self._records = []
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._db:
+            for statement in SCHEMA:
+                self._db.execute(statement)
+
+    def write(self, record):
+        self._records.append(record)
+        if len(self._records) >= self.batch_size:
+            self._write_batch()
+
+    def flush(self, force=False):
+        """
+        Вызывается каждые FLUSH_EVERY записей: пачка меньше batch_size не пишется.
+        force - записать все накопленное, например перед сохранением контрольной точки
+        """
+        if force or len(self._records) >= self.batch_size:
+            self._write_batch()
+
+    def _write_batch(self):
+        if not self._records:
+            return
+        latest = {doc_id_from_url(record['url']): record for record in self._records}
+        documents = []
+        postings = []
+        cases = set()
+        for doc_id, record in latest.items():
+            documents.append((doc_id, self.doc_type, record['number'], record['date'], record['zastroychik'],
+                              record['url']))
+            for kind, key in record_keys(record):
+                postings.append((kind, key, doc_id))
+                if kind == CASE:
+                    cases.add(key)
+        # Карточки дел уже в кэше: они запрашивались при сборке записей
+        case_names = [(case_number, self.get_organisation_name(case_number))
+                      for case_number in cases] if self.get_organisation_name else []
+        with self._db:
+            # Ключи документа заменяются целиком: у обновленного документа могли измениться участки
+            self._db.executemany('DELETE FROM postings WHERE doc_id = ?', [(doc_id,) for doc_id in latest])
+            self._db.executemany('INSERT OR IGNORE INTO postings (kind, key, doc_id) VALUES (?, ?, ?)', postings)
+            self._db.executemany(
+                'INSERT OR REPLACE INTO documents (doc_id, type, number, date, zastroychik, url) '
+                'VALUES (?, ?, ?, ?, ?, ?)', documents
+            )
+            # При временной ошибке карточки (None) остается застройщик, известный с прошлых выгрузок
+            self._db.executemany(
+                'INSERT INTO cases (case_number, organisation_name) VALUES (?, ?) ON CONFLICT(case_number) '
+                'DO UPDATE SET organisation_name = COALESCE(excluded.organisation_name, organisation_name)',
+                case_names
+            )
+        self._records = []
+
+    def close(self):
+        self._write_batch()
+        self._db.close()
+
+
+class CadIndex:
+    """ Поиск по индексу """
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+
+    def lookup(self, kind, key, doc_type=None):
+        """
+        Документы по кадастровому номеру (kind=CAD) или номеру дела (kind=CASE), по дате документа
+        :param doc_type: GPZU или RNS. Если None - все типы
+        :return: список словарей doc_id, type, number, date, zastroychik, url
+        """
+        sql = ('SELECT d.doc_id, d.type, d.number, d.date, d.zastroychik, d.url FROM postings p '
+               'JOIN documents d ON d.doc_id = p.doc_id WHERE p.kind = ? AND p.key = ?')
+        params = [kind, key]
+        if doc_type:
+            sql += ' AND d.type = ?'
+            params.append(doc_type)
+        rows = self._db.execute(sql + ' ORDER BY d.date', params).fetchall()
+        columns = ('doc_id', 'type', 'number', 'date', 'zastroychik', 'url')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def developers(self, kind, key):
+        """
+        Застройщики по кадастровому номеру (kind=CAD) - застройщики документов с этим номером,
+        по номеру дела (kind=CASE) - organisationName из карточки дела
+        """
+        if kind == CASE:
+            row = self._db.execute(
+                'SELECT organisation_name FROM cases WHERE case_number = ? AND organisation_name IS NOT NULL', (key,)
+            ).fetchone()
+            return [row[0]] if row else []
+        rows = self._db.execute(
+            'SELECT DISTINCT d.zastroychik FROM postings p JOIN documents d ON d.doc_id = p.doc_id '
+            'WHERE p.kind = ? AND p.key = ? AND d.zastroychik IS NOT NULL ORDER BY d.zastroychik', (kind, key)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        self._db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('index', help='файл индекса (ARG_CAD_INDEX)')
+    parser.add_argument('kind', choices=[CAD, CASE], help='cad - кадастровый номер, case - номер дела')
+    parser.add_argument('key', help='кадастровый номер или номер дела')
+    parser.add_argument('--type', choices=['GPZU', 'RNS'], help='только документы этого типа')
+    parser.add_argument('--developers', action='store_true', help='вывести только застройщиков')
+    args = parser.parse_args()
+
+    index = CadIndex(args.index)
+    try:
+        if args.developers:
+            result = index.developers(args.kind, args.key)
+        else:
+            result = index.lookup(args.kind, args.key, args.type)
+    finally:
+        index.close()
+    print(json.dumps(result, ensure_ascii=False, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class CaseCardCache:
+    """
+    Кэш результатов запроса карточек дел office-cases/{caseNumber}/card.
+    Хранит organisationName по номеру дела (None - если застройщика нет или сервер отдал 504).
+    Состоит из LRU в памяти процесса и необязательного хранилища на диске (SQLite) с TTL.
+    Одновременные запросы одного и того же номера дела из разных потоков выполняются один раз.
+    """
+
+    def __init__(self, max_size=50000, path=None, ttl=7 * 24 * 3600, negative_ttl=600):
+        """
+        :param max_size: сколько номеров дел держать в памяти
+        :param path: путь к файлу SQLite. Если None - кэш только в памяти
+        :param ttl: время жизни записи в секундах
+        :param negative_ttl: время жизни записи для временных ошибок (504)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS case_cards '
+                '(case_number TEXT PRIMARY KEY, organisation_name TEXT, expires_at REAL)'
+            )
+            self._db.commit()
+
+    def _get_memory(self, case_number, now):
+        item = self._lru.get(case_number)
+        if item is None:
+            return False, None
+        value, expires_at = item
+        if expires_at < now:
+            del self._lru[case_number]
+            return False, None
+        self._lru.move_to_end(case_number)
+        return True, value
+
+    def _set_memory(self, case_number, value, expires_at):
+        self._lru[case_number] = (value, expires_at)
+        self._lru.move_to_end(case_number)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def _get_disk(self, case_number, now):
+        if self._db is None:
+            return False, None, None
+        row = self._db.execute(
+            'SELECT organisation_name, expires_at FROM case_cards WHERE case_number = ?', (case_number,)
+        ).fetchone()
+        if row is None or row[1] < now:
+            return False, None, None
+        return True, row[0], row[1]
+
+    def _set_disk(self, case_number, value, expires_at):
+        if self._db is None:
+            return
+        self._db.execute(
+            'INSERT OR REPLACE INTO case_cards (case_number, organisation_name, expires_at) VALUES (?, ?, ?)',
+            (case_number, value, expires_at)
+        )
+        self._db.commit()
+
+    def get_or_load(self, case_number, loader):
+        """
+        Возвращает organisationName для номера дела из кэша, либо вызывает loader(case_number).
+        loader должен вернуть пару (значение, признак временной ошибки). Результаты временных ошибок
+        хранятся negative_ttl секунд, остальные - ttl.
+        """
+        now = time.time()
+        with self._lock:
+            found, value = self._get_memory(case_number, now)
+            if found:
+                self.hits += 1
+                return value
+            found, value, expires_at = self._get_disk(case_number, now)
+            if found:
+                self.disk_hits += 1
+                self._set_memory(case_number, value, expires_at)
+                return value
+            future = self._in_flight.get(case_number)
+            if future is None:
+                self.misses += 1
+                future = self._in_flight[case_number] = Future()
+                owner = True
+            else:
+                # Этот номер дела уже запрашивается в другом потоке
+                self.hits += 1
+                owner = False
+
+        if not owner:
+            return future.result()
+
+        try:
+            value, transient = loader(case_number)
+        except BaseException as ex:
+            with self._lock:
+                del self._in_flight[case_number]
+            future.set_exception(ex)
+            raise
+
+        expires_at = time.time() + (self.negative_ttl if transient else self.ttl)
+        with self._lock:
+            self._set_memory(case_number, value, expires_at)
+            self._set_disk(case_number, value, expires_at)
+            del self._in_flight[case_number]
+        future.set_result(value)
+        return value
+
+    def stats(self):
+        """ Возвращает счетчики попаданий и промахов кэша """
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / total, 4) if total else 0.0,
+                'size': len(self._lru),
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
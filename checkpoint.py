@@ -0,0 +1,113 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import date
+
+# Поля строки поиска docsSearch, изменение которых означает, что документ изменился
+FINGERPRINT_FIELDS = ('dateOfDocument', 'officialDocumentNumber', 'address', 'cadastralNumbers')
+# Части названий полей с отметками изменения документа, если они есть в строке поиска
+FINGERPRINT_KEY_PARTS = ('modif', 'updat', 'chang', 'version', 'edit')
+
+
+def row_fingerprint(row):
+    """ Отпечаток строки поиска: хэш полей FINGERPRINT_FIELDS и полей с отметками изменения """
+    fields = {key: row.get(key) for key in FINGERPRINT_FIELDS}
+    for key, value in row.items():
+        if any(part in key.lower() for part in FINGERPRINT_KEY_PARTS):
+            fields[key] = value
+    canonical = json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class Checkpoint:
+    """
+    Контрольная точка выгрузки в SQLite для одного типа документов.
+    Хранит id уже обработанных документов, отпечатки их строк поиска (row_fingerprint)
+    и watermark - максимальную дату документа последней успешно завершенной выгрузки, но не позже даты запуска:
+    в поиске бывают документы с датой в будущем, и watermark по ним пропустил бы все настоящие документы.
+    """
+
+    def __init__(self, path, type_):
+        self.type_ = type_
+        self._pending = []
+        self._pending_fingerprints = []
+        self._max_date = None
+        self._today = date.today().isoformat()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS done_documents '
+            '(type TEXT, doc_id TEXT, PRIMARY KEY (type, doc_id))'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS watermarks (type TEXT PRIMARY KEY, date TEXT)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS fingerprints '
+            '(type TEXT, doc_id TEXT, fingerprint TEXT, PRIMARY KEY (type, doc_id))'
+        )
+        self._db.commit()
+
+    def get_watermark(self):
+        """ Возвращает дату (YYYY-MM-DD) последней успешной выгрузки или None """
+        with self._lock:
+            row = self._db.execute('SELECT date FROM watermarks WHERE type = ?', (self.type_,)).fetchone()
+        # Watermark в будущем мог остаться от прошлых версий, без ограничения датой запуска
+        return min(row[0], self._today) if row else None
+
+    def is_done(self, doc_id):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT 1 FROM done_documents WHERE type = ? AND doc_id = ?', (self.type_, str(doc_id))
+            ).fetchone()
+        return row is not None
+
+    def get_fingerprint(self, doc_id):
+        """ Отпечаток строки поиска документа с прошлой выгрузки или None """
+        with self._lock:
+            row = self._db.execute(
+                'SELECT fingerprint FROM fingerprints WHERE type = ? AND doc_id = ?', (self.type_, str(doc_id))
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_done(self, doc_id, date_of_document=None, fingerprint=None):
+        """ Отмечает документ обработанным. В базу записывается при commit() """
+        with self._lock:
+            self._pending.append((self.type_, str(doc_id)))
+            if fingerprint:
+                self._pending_fingerprints.append((self.type_, str(doc_id), fingerprint))
+            if date_of_document:
+                day = min(date_of_document[:10], self._today)
+                if self._max_date is None or day > self._max_date:
+                    self._max_date = day
+
+    def commit(self):
+        """ Сохраняет отмеченные документы. Вызывать после сброса вывода, чтобы не потерять записи """
+        with self._lock:
+            if not self._pending:
+                return
+            with self._db:
+                self._db.executemany('INSERT OR IGNORE INTO done_documents (type, doc_id) VALUES (?, ?)',
+                                     self._pending)
+                self._db.executemany('INSERT OR REPLACE INTO fingerprints (type, doc_id, fingerprint) VALUES (?, ?, ?)',
+                                     self._pending_fingerprints)
+            self._pending = []
+            self._pending_fingerprints = []
+
+    def finish(self):
+        """ Завершает выгрузку: сохраняет watermark по максимальной дате обработанных документов """
+        self.commit()
+        with self._lock:
+            if self._max_date is None:
+                return
+            with self._db:
+                self._db.execute(
+                    'INSERT INTO watermarks (type, date) VALUES (?, ?) '
+                    'ON CONFLICT(type) DO UPDATE SET date = MAX(MIN(date, ?), excluded.date)',
+                    (self.type_, self._max_date, self._today)
+                )
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,42 @@
+import json
+import os
+from contextlib import nullcontext
+
+
+class CookieStore:
+    """ Хранит cookies авторизации из браузера в JSON-файле между запусками """
+
+    # Файл принадлежит одному процессу, cookies от других процессов в нем не появляются
+    shared = False
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """ Возвращает сохраненные cookies или None, если файла нет или он поврежден """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                cookies = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cookies if isinstance(cookies, list) else None
+
+    def save(self, cookies):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл и переименовываем, чтобы не оставить наполовину записанный файл
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, mode='w', encoding='utf-8') as f:
+            json.dump(cookies, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def login_lock(self):
+        """ Межпроцессная блокировка входа через браузер. Внутри процесса достаточно ProxyClient.login_lock """
+        return nullcontext()
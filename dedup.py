@@ -0,0 +1,34 @@
+import hashlib
+import json
+
+
+class Deduplicator:
+    """
+    Отсеивает повторяющиеся записи за O(1) на запись.
+    Вместо самих записей хранит их ключи в множестве:
+    content - хэш канонического JSON всей записи (совпадает с прежним сравнением словарей),
+    url - адрес документа.
+    """
+
+    def __init__(self, key='content'):
+        if key not in ('content', 'url'):
+            raise Exception(f'Неверный ключ дедупликации {key} (допустимо content, url)')
+        self.key = key
+        self._seen = set()
+
+    def record_key(self, record):
+        if self.key == 'url':
+            return record['url']
+        canonical = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).digest()
+
+    def add(self, record):
+        """ Запоминает запись. Возвращает False, если такая запись уже встречалась """
+        key = self.record_key(record)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        return True
+
+    def __len__(self):
+        return len(self._seen)
@@ -0,0 +1,175 @@
+"""
+Сервис авторизации на gisogd.mos.ru.
+Держит запущенными браузеры на постоянных профилях (один профиль на прокси) и отдает cookies по запросу,
+поэтому парсерам не нужно каждый раз запускать Chrome с нуля. Упавшие браузеры перезапускаются.
+
+Запуск: python login_service.py
+Парсер: ARG_LOGIN_SERVICE=http://127.0.0.1:8765 python parser.py
+Запрос: GET /cookies?proxy=<прокси> - JSON-список cookies в формате selenium
+"""
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from parser import ARG_FAST_LOGIN, ARG_HEADLESS, EMAIL, PASSWORD, is_authorized, login_in_browser, set_cookies
+from transport import make_session
+from utils import Proxy, get_profile_dir, start_driver, unlock_profile
+
+
+class BrowserSlot:
+    """ Долгоживущий браузер для одного прокси """
+
+    def __init__(self, proxy):
+        self.proxy = proxy or None
+        self.profile_dir = get_profile_dir(self.proxy)
+        self.driver = None
+        # Session для проверки cookies, одна на все время работы сервиса
+        self.session = None
+        self.lock = threading.Lock()
+
+    def is_alive(self):
+        if self.driver is None:
+            return False
+        try:
+            self.driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def start(self):
+        self.stop()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        unlock_profile(self.profile_dir)
+        logging.info('Запуск браузера для прокси %s', self.proxy)
+        self.driver = start_driver(self.proxy, profile_dir=self.profile_dir, fast=ARG_FAST_LOGIN, headless=ARG_HEADLESS)
+
+    def stop(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+            self.driver = None
+
+    def ensure_alive(self):
+        with self.lock:
+            if not self.is_alive():
+                self.start()
+
+    def _cookies_valid(self, cookies):
+        # Сервис работает днями: новая session на каждый запрос накапливала бы пулы соединений
+        if self.session is None:
+            self.session = make_session(Proxy.from_str(self.proxy).to_url() if self.proxy else None, pool_size=1)
+        self.session.cookies.clear()
+        set_cookies(cookies, self.session)
+        return is_authorized(self.session)
+
+    def get_cookies(self):
+        """ Возвращает действующие cookies: текущие из браузера, либо после повторного входа """
+        with self.lock:
+            if not self.is_alive():
+                self.start()
+            cookies = self.driver.get_cookies()
+            if cookies and self._cookies_valid(cookies):
+                return cookies
+            self.driver.delete_all_cookies()
+            start = time.perf_counter()
+            try:
+                cookies = login_in_browser(self.driver, EMAIL, PASSWORD)
+            except Exception:
+                # Браузер мог упасть во время входа - перезапускаем и пробуем еще раз
+                logging.exception('Ошибка входа для прокси %s, перезапуск браузера', self.proxy)
+                self.start()
+                cookies = login_in_browser(self.driver, EMAIL, PASSWORD)
+            logging.info('Вход для прокси %s за %.1f с', self.proxy, time.perf_counter() - start)
+            return cookies
+
+
+class LoginService:
+    """ Набор браузеров по прокси и фоновая проверка, что они живы """
+
+    def __init__(self, proxies=(), check_interval=60):
+        self.slots = {}
+        self.lock = threading.Lock()
+        self.check_interval = check_interval
+        for proxy in proxies:
+            self.get_slot(proxy)
+
+    def get_slot(self, proxy):
+        with self.lock:
+            slot = self.slots.get(proxy or None)
+            if slot is None:
+                slot = self.slots[proxy or None] = BrowserSlot(proxy)
+        return slot
+
+    def get_cookies(self, proxy):
+        return self.get_slot(proxy).get_cookies()
+
+    def watch(self):
+        """ Перезапускает упавшие браузеры """
+        while True:
+            for slot in list(self.slots.values()):
+                try:
+                    slot.ensure_alive()
+                except Exception:
+                    logging.exception('Не удалось перезапустить браузер для прокси %s', slot.proxy)
+            time.sleep(self.check_interval)
+
+    def stop(self):
+        for slot in self.slots.values():
+            slot.stop()
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/cookies':
+                self.send_error(404)
+                return
+            proxy = parse_qs(url.query).get('proxy', [''])[0]
+            try:
+                cookies = service.get_cookies(proxy)
+            except Exception as ex:
+                logging.exception('Не удалось получить cookies для прокси %s', proxy)
+                self.send_error(502, str(ex))
+                return
+            body = json.dumps(cookies).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.info('%s %s', self.address_string(), format % args)
+
+    return Handler
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    host = os.getenv('ARG_LOGIN_SERVICE_HOST', default='127.0.0.1')
+    port = int(os.getenv('ARG_LOGIN_SERVICE_PORT', default=8765))
+    # Прокси, для которых браузеры запускаются сразу, через запятую. Пустой элемент - без прокси:
+    # "" - только без прокси, "host:port," - с прокси и без него
+    login_proxies = os.getenv('ARG_LOGIN_PROXIES', default=None)
+    proxies = [p.strip() or None for p in login_proxies.split(',')] if login_proxies is not None else []
+    check_interval = int(os.getenv('ARG_LOGIN_CHECK_INTERVAL', default=60))
+
+    service = LoginService(proxies, check_interval=check_interval)
+    threading.Thread(target=service.watch, daemon=True).start()
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    logging.info('Сервис авторизации запущен на %s:%s', host, port)
+    try:
+        server.serve_forever()
+    finally:
+        service.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Метрики выгрузки: число вызовов, ошибки и гистограммы длительности по этапам
+(вход, страница поиска, brief, карточка дела, разбор ТЭП, вывод), строка прогресса и режим профилирования.
+"""
+import cProfile
+import json
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Верхние границы корзин гистограммы длительности, секунды
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class StageStats:
+    """ Счетчики и гистограмма длительности одного этапа """
+
+    __slots__ = ('count', 'errors', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        # Последняя корзина - больше BUCKETS[-1]
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds, error):
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def quantile(self, q):
+        """ Оценка квантиля по гистограмме: верхняя граница корзины """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class Metrics:
+    """ Метрики этапов выгрузки. Потокобезопасны """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.documents = 0
+        # Сколько документов ожидается по total из поиска, None - пока неизвестно
+        self.expected = None
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.observe(seconds, error)
+
+    @contextmanager
+    def timer(self, stage):
+        """ Замеряет длительность блока. Исключение в блоке учитывается как ошибка этапа """
+        start = time.perf_counter()
+        error = True
+        try:
+            yield
+            error = False
+        finally:
+            self.observe(stage, time.perf_counter() - start, error)
+
+    def add_documents(self, count=1):
+        with self._lock:
+            self.documents += count
+
+    def add_expected(self, count):
+        with self._lock:
+            self.expected = (self.expected or 0) + count
+
+    def progress(self):
+        """ Строка прогресса: документы, документы в секунду и оценка оставшегося времени """
+        with self._lock:
+            documents, expected = self.documents, self.expected
+        elapsed = time.monotonic() - self.started
+        rate = documents / elapsed if elapsed > 0 else 0.0
+        line = f'документов {documents}'
+        if expected:
+            line += f' из {expected}'
+        line += f', {rate:.1f} док/с'
+        if expected and rate > 0 and expected > documents:
+            line += f', осталось ~{int((expected - documents) / rate)} с'
+        return line
+
+    def snapshot(self):
+        """ Метрики в виде словаря """
+        with self._lock:
+            stages = {
+                name: {
+                    'count': stats.count,
+                    'errors': stats.errors,
+                    'seconds_total': round(stats.total, 6),
+                    'seconds_max': round(stats.max, 6),
+                    'p50': stats.quantile(0.5),
+                    'p99': stats.quantile(0.99),
+                    'buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'], stats.buckets)),
+                }
+                for name, stats in sorted(self._stages.items())
+            }
+            return {
+                'elapsed_seconds': round(time.monotonic() - self.started, 3),
+                'documents': self.documents,
+                'expected_documents': self.expected,
+                'stages': stages,
+            }
+
+    def to_prometheus(self):
+        """ Метрики в текстовом формате Prometheus """
+        snapshot = self.snapshot()
+        lines = [
+            '# TYPE gisogd_documents_total counter',
+            f'gisogd_documents_total {snapshot["documents"]}',
+            '# TYPE gisogd_elapsed_seconds gauge',
+            f'gisogd_elapsed_seconds {snapshot["elapsed_seconds"]}',
+            '# TYPE gisogd_stage_errors_total counter',
+        ]
+        for name, stage in snapshot['stages'].items():
+            lines.append(f'gisogd_stage_errors_total{{stage="{name}"}} {stage["errors"]}')
+        lines.append('# TYPE gisogd_stage_seconds histogram')
+        for name, stage in snapshot['stages'].items():
+            cumulative = 0
+            for bound, count in stage['buckets'].items():
+                cumulative += count
+                lines.append(f'gisogd_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'gisogd_stage_seconds_sum{{stage="{name}"}} {stage["seconds_total"]}')
+            lines.append(f'gisogd_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """ Записывает метрики в файл: .json - JSON, иначе текстовый формат Prometheus """
+        if path.endswith('.json'):
+            text = json.dumps(self.snapshot(), ensure_ascii=False, indent=4)
+        else:
+            text = self.to_prometheus()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def log_summary(self):
+        for name, stage in self.snapshot()['stages'].items():
+            logging.info('Этап %s: вызовов %s, ошибок %s, всего %.1f с, p50 <= %s с, p99 <= %s с',
+                         name, stage['count'], stage['errors'], stage['seconds_total'], stage['p50'], stage['p99'])
+
+
+class ProgressReporter:
+    """ Фоновый поток, который раз в interval секунд пишет в лог строку прогресса """
+
+    def __init__(self, metrics, interval):
+        self.metrics = metrics
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            logging.info('Прогресс: %s', self.metrics.progress())
+
+    def __enter__(self):
+        if self.interval > 0:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        logging.info('Итого: %s', self.metrics.progress())
+
+
+@contextmanager
+def profiling(mode, path):
+    """
+    Профилирование блока с записью результата в файл для последующего анализа
+    :param mode: cpu - cProfile по всем потокам (файл для pstats/snakeviz), memory - снимок tracemalloc
+        (tracemalloc.Snapshot.load), None - без профилирования
+    """
+    if not mode:
+        yield
+        return
+    if mode == 'cpu':
+        profiles = [cProfile.Profile()]
+
+        def start_thread_profile(*args):
+            # Вызывается первым событием в каждом новом потоке и заменяется профилировщиком потока
+            profile = cProfile.Profile()
+            profiles.append(profile)
+            profile.enable()
+
+        threading.setprofile(start_thread_profile)
+        profiles[0].enable()
+        try:
+            yield
+        finally:
+            profiles[0].disable()
+            threading.setprofile(None)
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                profile.disable()
+                stats.add(profile)
+            stats.dump_stats(path)
+            logging.info('Профиль CPU записан в %s', path)
+    elif mode == 'memory':
+        # Один кадр стека на выделение: полные стеки замедляют выгрузку на порядок
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            logging.info('Память: сейчас %.1f МБ, пик %.1f МБ', current / 2 ** 20, peak / 2 ** 20)
+            snapshot.dump(path)
+            for stat in snapshot.statistics('lineno')[:10]:
+                logging.info('Память: %s', stat)
+            logging.info('Снимок памяти записан в %s', path)
+    else:
+        raise Exception(f'Неверный режим профилирования {mode} (допустимо cpu, memory)')
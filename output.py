@@ -0,0 +1,67 @@
+import json
+import sys
+
+
+class NdjsonWriter:
+    """ Пишет по одной компактной JSON-записи на строку сразу после обработки документа """
+
+    def __init__(self, stream, close_stream=False):
+        self.stream = stream
+        self.close_stream = close_stream
+
+    def write(self, record):
+        self.stream.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        self.stream.write('\n')
+
+    def flush(self, force=False):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        if self.close_stream:
+            self.stream.close()
+
+
+class JsonArrayWriter:
+    """
+    Пишет записи в виде JSON-массива с отступами, как json.dumps(records, indent=4).
+    Записи выводятся по мере поступления, массив закрывается в close().
+    """
+
+    def __init__(self, stream, close_stream=False, indent=4):
+        self.stream = stream
+        self.close_stream = close_stream
+        self.indent = indent
+        self.count = 0
+
+    def write(self, record):
+        prefix = ' ' * self.indent
+        text = json.dumps(record, indent=self.indent, ensure_ascii=False, sort_keys=False)
+        self.stream.write('[\n' if not self.count else ',\n')
+        self.stream.write(prefix + text.replace('\n', '\n' + prefix))
+        self.count += 1
+
+    def flush(self, force=False):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.write('\n]\n' if self.count else '[]\n')
+        self.flush()
+        if self.close_stream:
+            self.stream.close()
+
+
+def open_writer(fmt='json', path=None, append=False):
+    """
+    Возвращает writer для вывода записей
+    :param fmt: json - JSON-массив с отступами, ndjson - одна запись на строку
+    :param path: путь к файлу. Если None - вывод в stdout
+    :param append: дописывать записи в существующий файл (только для ndjson)
+    """
+    if fmt not in ('json', 'ndjson'):
+        raise Exception(f'Неверный формат вывода {fmt} (допустимо json, ndjson)')
+    if append and path and fmt != 'ndjson':
+        raise Exception('Дописывать в существующий файл можно только в формате ndjson')
+    stream = open(path, mode='a' if append else 'w', encoding='utf-8') if path else sys.stdout
+    writer_cls = NdjsonWriter if fmt == 'ndjson' else JsonArrayWriter
+    return writer_cls(stream, close_stream=bool(path))
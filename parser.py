@@ -1,6 +1,9 @@
-import json
 import logging
 import os
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, date
 
 import requests
@@ -8,14 +11,47 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.wait import WebDriverWait
 
-from utils import get_driver
+from archive import RawArchive
+from cad_index import CadIndexWriter
+from case_cache import CaseCardCache
+from checkpoint import Checkpoint, row_fingerprint
+from dedup import Deduplicator
+from metrics import Metrics, ProgressReporter, profiling
+from output import open_writer
+from proxy_pool import ProxyPool, parse_proxies
+from rate_limit import RETRY_STATUSES, AimdLimiter, RetryPolicy, parse_retry_after
+from sqlite_sink import SqliteSink
+from tep_decoder import decode_custom_attributes
+from tep_export import TepExportWriter
+from transport import TRANSIENT_ERRORS, make_session
+from utils import AnyEc, cookie_present, get_driver
+from work_queue import DONE, FAILED, LEASED, PENDING, QueueCookieStore, WorkQueue
 
 
 class UnauthorizedException(Exception):
     pass
 
 
+# Максимальный размер страницы docsSearch, который запрашивает парсер. Больше не ставим:
+# ответ на страницу растет линейно, а страница все равно обрабатывается целиком
+MAX_PAGE_SIZE = 500
+# Код раздела в поиске docsSearch по типу документа
+CHAPTER_CODES = {'GPZU': 'GPZU', 'RNS': 'RS'}
+
+SEARCH_HEADERS = {
+    'Content-Type': 'application/json',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36',
+    'Origin': 'https://gisogd.mos.ru',
+    'Referer': 'https://gisogd.mos.ru/documents',
+
+}
+
+
 class DataObject:
+    # Порядок полей - порядок ключей в выводе
+    __slots__ = ('region', 'date', 'number', 'zastroychik', 'cad_numbers', 'details', 'teps', 'additional_teps',
+                 'url', 'cad_links', 'tep_groups', 'additional_teps_groups', 'description', 'fno', 'address')
+
     def __init__(self):
         self.region: str = 'moscow'
         self.date: str = None
@@ -31,43 +67,215 @@ class DataObject:
         self.additional_teps_groups: dict = None
         self.description: str = None
         self.fno: str = None
+        self.address: str = None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def login_in_browser(driver, email, password):
+    """ Выполняет вход на gisogd.mos.ru в открытом браузере и возвращает cookies """
+    driver.get('https://gisogd.mos.ru/')
+    WebDriverWait(driver, 60).until(
+        EC.visibility_of_element_located((By.XPATH, '//button[@class="btn btn-primary"]'))
+    )
+    enter_but = driver.find_element(By.XPATH, '//button[@class="btn btn-primary"]')
+    enter_but.click()
+    WebDriverWait(driver, 60).until(
+        EC.visibility_of_element_located((By.XPATH, '//input[@name="login"]'))
+    )
+    mail_area = driver.find_element(By.XPATH, '//input[@name="login"]')
+    mail_area.send_keys(email)
+    pass_area = driver.find_element(By.XPATH, '//input[@name="password"]')
+    pass_area.send_keys(password)
+    button = driver.find_element(By.XPATH, '//button[@class="form-login__submit"]')
+    button.click()
+    search_button = EC.visibility_of_element_located((By.XPATH, '//button[contains(@class, "advanced-search-toggle")]'))
+    # Cookie авторизации появляется раньше, чем интерфейс поиска, поэтому ждем то, что наступит первым
+    fired = WebDriverWait(driver, 60).until(
+        AnyEc(search_button, cookie_present(ARG_AUTH_COOKIE) if ARG_AUTH_COOKIE else None)
+    )
+    # Если первой появилась cookie, интерфейс поиска не нужен: cookies уже действуют
+    if not ARG_FAST_LOGIN and fired is search_button:
+        filter_but = driver.find_element(By.XPATH, '//button[contains(@class, "advanced-search-toggle")]')
+        filter_but.click()
+    return driver.get_cookies()
 
 
 def get_cookies(email, password, proxy_):
-    with get_driver(proxy=proxy_) as driver:
-        driver.get('https://gisogd.mos.ru/')
-        WebDriverWait(driver, 60).until(
-            EC.visibility_of_element_located((By.XPATH, '//button[@class="btn btn-primary"]'))
-        )
-        enter_but = driver.find_element(By.XPATH, '//button[@class="btn btn-primary"]')
-        enter_but.click()
-        WebDriverWait(driver, 60).until(
-            EC.visibility_of_element_located((By.XPATH, '//input[@name="login"]'))
-        )
-        mail_area = driver.find_element(By.XPATH, '//input[@name="login"]')
-        mail_area.send_keys(email)
-        pass_area = driver.find_element(By.XPATH, '//input[@name="password"]')
-        pass_area.send_keys(password)
-        button = driver.find_element(By.XPATH, '//button[@class="form-login__submit"]')
-        button.click()
-        WebDriverWait(driver, 60).until(
-            EC.visibility_of_element_located((By.XPATH, '//button[contains(@class, "advanced-search-toggle")]'))
-        )
-        filter_but = driver.find_element(By.XPATH, '//button[contains(@class, "advanced-search-toggle")]')
-        filter_but.click()
-        cookies = driver.get_cookies()
+    if ARG_LOGIN_SERVICE:
+        return get_service_cookies(proxy_)
+    start = time.perf_counter()
+    with get_driver(proxy=proxy_, fast=ARG_FAST_LOGIN, headless=ARG_HEADLESS) as driver:
+        cookies = login_in_browser(driver, email, password)
         driver.quit()
+        logging.info('Вход через браузер для прокси %s за %.1f с', proxy_, time.perf_counter() - start)
 
         return cookies
 
 
-def set_cookies(cookies):
+def get_service_cookies(proxy_):
+    """ Получает cookies у сервиса авторизации (login_service.py), который держит запущенные браузеры """
+    with requests.get(f'{ARG_LOGIN_SERVICE.rstrip("/")}/cookies', params={'proxy': proxy_ or ''},
+                      timeout=300) as req:
+        req.raise_for_status()
+        return req.json()
+
+
+def set_cookies(cookies, session_):
     for cookie in cookies:
-        session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'],
-                            secure=cookie['secure'], expires=cookie.get('expiry', None))
+        session_.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'],
+                             secure=cookie['secure'], expires=cookie.get('expiry', None))
 
 
-def extract_data(data):
+def is_authorized(session_):
+    """ Проверяет текущие cookies одним запросом поиска на один документ """
+    p_d = {
+        "pagination": {"size": 1, "page": 0, "sortModel": {"field": "dateOfRegistration", "order": "ASC"}},
+        "request": "chapterCode:(\"GPZU\")"
+    }
+    with session_.post(f'{ARG_API_URL}/solr/docsSearch', json=p_d, headers=SEARCH_HEADERS,
+                       timeout=(ARG_CONNECT_TIMEOUT, ARG_READ_TIMEOUT)) as req:
+        return req.status_code == 200
+
+
+def login(client):
+    """
+    Авторизует session прокси. Сначала пробует cookies, сохраненные прошлым запуском,
+    браузер запускается только если они недействительны.
+    """
+    with client.login_lock:
+        cookies = client.cookie_store.load()
+        if cookies:
+            set_cookies(cookies, client.session)
+            if is_authorized(client.session):
+                logging.info('Используются сохраненные cookies для прокси %s', client.proxy)
+                return
+            client.session.cookies.clear()
+        browser_login(client)
+
+
+def browser_login(client):
+    """ Получает cookies через браузер и сохраняет их на диск. Вызывается под client.login_lock """
+    with client.cookie_store.login_lock():
+        # С общим хранилищем (MODE) другой процесс мог войти, пока мы ждали блокировку
+        if client.cookie_store.shared:
+            cookies = client.cookie_store.load()
+            if cookies:
+                set_cookies(cookies, client.session)
+                if is_authorized(client.session):
+                    logging.info('Используются cookies другого процесса для прокси %s', client.proxy)
+                    client.auth_generation += 1
+                    return
+                client.session.cookies.clear()
+        with metrics.timer('login'):
+            cookies = get_cookies(EMAIL, PASSWORD, client.proxy)
+        set_cookies(cookies, client.session)
+        client.auth_generation += 1
+        try:
+            client.cookie_store.save(cookies)
+        except OSError as ex:
+            logging.warning('Не удалось сохранить cookies в %s: %s', client.cookie_store.path, ex)
+
+
+def relogin(client, generation):
+    """
+    Повторная авторизация через браузер после 401. generation - номер авторизации, с которой получен 401:
+    если другой поток уже авторизовался заново, повторно браузер не запускается.
+    """
+    with client.login_lock:
+        if generation != client.auth_generation:
+            return
+        logging.info('Сессия истекла, повторная авторизация для прокси %s', client.proxy)
+        client.session.cookies.clear()
+        browser_login(client)
+
+
+def send_request(method, url, **kwargs):
+    """
+    Выполняет один запрос к API через один из прокси пула.
+    При 401 выполняет повторную авторизацию и повторяет запрос один раз
+    """
+    client = proxy_pool.acquire()
+    start = time.monotonic()
+    ok = False
+    try:
+        generation = client.auth_generation
+        kwargs.setdefault('timeout', (ARG_CONNECT_TIMEOUT, ARG_READ_TIMEOUT))
+        req = client.session.request(method, url, **kwargs)
+        if req.status_code == 401:
+            req.close()
+            relogin(client, generation)
+            req = client.session.request(method, url, **kwargs)
+            if req.status_code == 401:
+                req.close()
+                raise UnauthorizedException()
+        # Блокировки и перегрузка прокси выглядят как 403 и 429. 5xx - ошибки самого сервера (карточки дел
+        # регулярно отдают 504), прокси в них не виноват, а перегрузку сервера учитывает limiter
+        ok = req.status_code not in (403, 429)
+        return req
+    finally:
+        proxy_pool.release(client, time.monotonic() - start, ok)
+
+
+def api_request(method, url, **kwargs):
+    """
+    Выполняет запрос к API с ограничением числа одновременных запросов и повторами
+    при 429/5xx и обрывах соединения. Если повторы не помогли, возвращает последний ответ
+    или выбрасывает последнюю ошибку соединения
+    """
+    for attempt in range(retry_policy.max_attempts):
+        last_attempt = attempt == retry_policy.max_attempts - 1
+        limiter.acquire()
+        try:
+            req = send_request(method, url, **kwargs)
+        except TRANSIENT_ERRORS:
+            limiter.on_overload()
+            if last_attempt:
+                raise
+            retry_after = None
+        else:
+            if req.status_code not in RETRY_STATUSES:
+                limiter.on_success()
+                return req
+            retry_after = parse_retry_after(req.headers.get('Retry-After'))
+            limiter.on_overload(retry_after)
+            if last_attempt:
+                return req
+            req.close()
+        finally:
+            limiter.release()
+        time.sleep(retry_policy.delay(attempt, retry_after))
+
+
+def organisation_name_from_card(status, card):
+    """ Возвращает пару (organisationName, признак временной ошибки) по ответу карточки дела """
+    # Бывает отдает 504 ошибку, даже после повторов
+    if status == 504:
+        return None, True
+    if 'officeCase' in card:
+        if 'organisationName' in card['officeCase']:
+            return card['officeCase']['organisationName'] or None, False
+    return None, False
+
+
+def fetch_organisation_name(case_number):
+    """ Запрашивает карточку дела и возвращает пару (organisationName, признак временной ошибки) """
+    with metrics.timer('card'), api_request('GET', f'{ARG_API_URL}/gisogd/office-cases/{case_number}/card') as req:
+        if req.status_code != 504:
+            req.raise_for_status()
+        if archive is not None:
+            archive.add_card(case_number, req.status_code, req.content)
+        if req.status_code == 504:
+            return None, True
+        return organisation_name_from_card(req.status_code, req.json())
+
+
+def build_object(data, add_data, get_organisation_name):
+    """
+    Собирает DataObject из строки поиска и brief документа без запросов к сети
+    :param get_organisation_name: функция номер дела -> organisationName или None
+    """
     obj = DataObject()
 
     obj.date = data['dateOfDocument']
@@ -77,80 +285,10 @@ def extract_data(data):
     if 'cadastralNumbers' in data:
         obj.cad_numbers = data['cadastralNumbers']
 
-    detail_url = 'https://gisogd.mos.ru/isogd/front/api/gisogd/documents/{}/brief'
-
-    with session.get(detail_url.format(data['id'])) as req:
-        req.raise_for_status()
-        add_data = req.json()
-
-    custom_attr = json.loads(add_data['customAttributes'])
-    other_details = {}
-    for attr in custom_attr:
-        if 'tepList' in attr['code']:
-            tep_dict = {}
-            attr_dict = json.loads(attr['value'])
-            for element in attr_dict:
-                if len(element) == 2:
-                    name, value = element
-                else:
-                    continue
-                if 'tepListTepName' in name:
-                    tep_dict[value['value']] = name['value']
-                else:
-                    tep_dict[name['value']] = value['value']
-            obj.teps = tep_dict
-        elif 'dopTepList' in attr['code']:
-            tep_dict = {}
-            attr_dict = json.loads(attr['value'])
-            for element in attr_dict:
-                if len(element) == 2:
-                    name, value = element
-                else:
-                    continue
-                if 'tepListTepName' in name:
-                    tep_dict[value['value']] = name['value']
-                else:
-                    tep_dict[name['value']] = value['value']
-            obj.additional_teps = tep_dict
-        elif 'tepGroups' in attr['code']:
-            tep_groups = {}
-            attr_dict = json.loads(attr['value'])
-            for group in attr_dict:
-                for det in group:
-                    if 'tepGroupsGroupName' in det['code']:
-                        name_tepgroup = det['value']
-                    else:
-                        group_det = {}
-                        attr_list = json.loads(det['value'])
-                        for tep in attr_list:
-                            name, value = tep
-                            if 'tepGroupsTepListTepValue' in name:
-                                group_det[value['value']] = name['value']
-                            else:
-                                group_det[name['value']] = value['value']
-                        tep_groups[name_tepgroup] = group_det
-            obj.tep_groups = tep_groups
-        elif 'dopTepGroups' in attr['code']:
-            tep_groups = {}
-            attr_dict = json.loads(attr['value'])
-            for group in attr_dict:
-                for det in group:
-                    if 'dopTepGroupsGroupName' in det['code']:
-                        name_tepgroup = det['value']
-                    else:
-                        group_det = {}
-                        attr_list = json.loads(det['value'])
-                        for tep in attr_list:
-                            name, value = tep
-                            if 'dopTepGroupsTepListTepName' in name:
-                                group_det[value['value']] = name['value']
-                            else:
-                                group_det[name['value']] = value['value']
-                        tep_groups[name_tepgroup] = group_det
-            obj.additional_teps_groups = tep_groups
-        else:
-            other_details[attr['name']] = attr['value']
-
+    with metrics.timer('decode'):
+        teps, other_details = decode_custom_attributes(add_data['customAttributes'])
+    for field, value in teps.items():
+        setattr(obj, field, value)
     obj.details = other_details
 
     links = []
@@ -164,17 +302,9 @@ def extract_data(data):
             for cad_link in terrain['cadastralNumbers']:
                 if 'caseNumber' in cad_link:
                     links.append(f'https://gisogd.mos.ru/cases/{cad_link["caseNumber"]}')
-                    with session.get(f'https://gisogd.mos.ru/isogd/front/api/gisogd/office-cases/{cad_link["caseNumber"]}/card') as req:
-                        # Бывает отдает 504 ошибку
-                        if req.status_code == 504:
-                            continue
-                        req.raise_for_status()
-                        zastr_data = req.json()
-                        if 'officeCase' in zastr_data:
-                            if 'organisationName' in zastr_data['officeCase']:
-                                zastroychik = req.json()['officeCase']['organisationName']
-                                if zastroychik:
-                                    obj.zastroychik = zastroychik
+                    zastroychik = get_organisation_name(cad_link['caseNumber'])
+                    if zastroychik:
+                        obj.zastroychik = zastroychik
 
     if links:
         obj.cad_links = links
@@ -183,45 +313,174 @@ def extract_data(data):
     return obj
 
 
-def get_objects(type_, date=None):
+def get_organisation_name(case_number):
+    return case_cache.get_or_load(case_number, fetch_organisation_name)
+
+
+def extract_data(data):
+    with metrics.timer('brief'), api_request('GET', f'{ARG_API_URL}/gisogd/documents/{data["id"]}/brief') as req:
+        req.raise_for_status()
+        if archive is not None:
+            archive.add_brief(data['id'], req.content)
+        add_data = req.json()
+
+    return build_object(data, add_data, get_organisation_name)
+
+
+def search_page(type_, date, page, size, date_to=None):
+    """
+    Запрашивает одну страницу поиска docsSearch
+    :param date: документы с датой не раньше date
+    :param date_to: документы с датой строго раньше date_to. Если None - без ограничения
+    """
+    date_range = f'[{date}T00:00:00.000Z TO {date_to}T00:00:00.000Z}}' if date_to else f'[{date}T00:00:00.000Z TO *]'
     p_d = {
         "pagination":
             {
-                "size": 100,
-                "page": 0,
+                "size": size,
+                "page": page,
                 "sortModel":
                     {
                         "field": "dateOfRegistration",
                         "order": "ASC"
                     }
             },
-        "request": f"chapterCode:(\"{type_}\") AND dateOfDocument:[{date}T00:00:00.000Z TO *]"
+        "request": f"chapterCode:(\"{type_}\") AND dateOfDocument:{date_range}"
     }
 
-    headers = {
-        'Content-Type': 'application/json',
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36',
-        'Origin': 'https://gisogd.mos.ru',
-        'Referer': 'https://gisogd.mos.ru/documents',
-
-    }
-
-    all_data = []
-    while True:
-        with session.post('https://gisogd.mos.ru/isogd/front/api/solr/docsSearch', json=p_d, headers=headers) as req:
-            if req.status_code != 200:
-                if req.status_code == 401:
-                    raise UnauthorizedException()
-                req.raise_for_status()
-            all_json = req.json()
+    with metrics.timer('docsSearch'), api_request('POST', f'{ARG_API_URL}/solr/docsSearch', json=p_d,
+                                                  headers=SEARCH_HEADERS) as req:
+        req.raise_for_status()
+        result = req.json()
+        if archive is not None:
+            archive.add_search_page(type_, p_d['request'], page, req.content, result['data'])
+        return result
+
+
+def get_objects(type_, date=None, page_size=100, date_to=None):
+    """
+    Генератор документов из поиска docsSearch. Отдает документы постранично,
+    следующая страница запрашивается в фоне, пока обрабатывается текущая.
+    :param date_to: документы с датой строго раньше date_to. Если None - без ограничения
+    """
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise Exception(f'Неверный размер страницы {page_size} (допустимо от 1 до {MAX_PAGE_SIZE})')
+
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        page = 0
+        loaded = 0
+        future = prefetcher.submit(search_page, type_, date, page, page_size, date_to)
+        while future is not None:
+            all_json = future.result()
             objects = all_json['data']
-            all_data.extend(objects)
             total = all_json['pagination']['total']
-            if len(all_data) < total:
-                p_d['pagination']['page'] += 1
+            if page == 0:
+                metrics.add_expected(total)
+            loaded += len(objects)
+            page += 1
+            # Пустая страница - защита от зацикливания, если total изменился во время выгрузки
+            if objects and loaded < total:
+                future = prefetcher.submit(search_page, type_, date, page, page_size, date_to)
             else:
-                break
-    return all_data
+                future = None
+            yield from objects
+
+
+def split_windows(date_from, date_to, shard):
+    """ Разбивает интервал дат [date_from, date_to) на окна по дню, неделе или месяцу """
+    windows = []
+    start = date_from
+    while start < date_to:
+        if shard == 'day':
+            end = start + timedelta(days=1)
+        elif shard == 'week':
+            end = start + timedelta(days=7 - start.weekday())
+        elif shard == 'month':
+            end = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        else:
+            raise Exception(f'Неверный размер окна {shard} (допустимо day, week, month)')
+        end = min(end, date_to)
+        windows.append((start, end))
+        start = end
+    return windows
+
+
+def search_window(type_, window, page_size):
+    """
+    Выгружает все документы окна дат (date_from, date_to). date_to=None - без верхней границы.
+    Если в окне больше SHARD_MAX_TOTAL документов, окно делится пополам, чтобы не уходить в глубокую пагинацию.
+    """
+    date_from, date_to = window
+    first = search_page(type_, date_from.isoformat(), 0, page_size,
+                        date_to.isoformat() if date_to else None)
+    total = first['pagination']['total']
+    if total > ARG_SHARD_MAX_TOTAL and date_to and (date_to - date_from).days > 1:
+        middle = date_from + timedelta(days=(date_to - date_from).days // 2)
+        return search_window(type_, (date_from, middle), page_size) + search_window(type_, (middle, date_to), page_size)
+    metrics.add_expected(total)
+
+    docs = list(first['data'])
+    page = 1
+    while first['data'] and len(docs) < total:
+        all_json = search_page(type_, date_from.isoformat(), page, page_size,
+                               date_to.isoformat() if date_to else None)
+        if not all_json['data']:
+            break
+        docs.extend(all_json['data'])
+        page += 1
+    return docs
+
+
+def get_objects_sharded(type_, date, page_size=100, shard='month', workers=4, date_to=None):
+    """
+    Генератор документов из поиска docsSearch с разбиением интервала дат на окна.
+    Окна выгружаются параллельно, документы отдаются по порядку окон, внутри окна - в порядке поиска.
+    Документы, попавшие в несколько окон (например, измененные во время выгрузки), отдаются один раз.
+    :param date_to: документы с датой строго раньше date_to. Если None - без ограничения
+    """
+    date_from = datetime.strptime(date, '%Y-%m-%d').date()
+    if date_to:
+        windows = split_windows(date_from, datetime.strptime(date_to, '%Y-%m-%d').date(), shard)
+    else:
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        # Последнее окно без верхней границы - документы с датой в будущем, как в обычном поиске
+        windows = split_windows(date_from, tomorrow, shard) + [(max(date_from, tomorrow), None)]
+
+    seen_ids = set()
+    for docs in ordered_map(lambda window: search_window(type_, window, page_size), windows, workers):
+        for doc in docs:
+            if doc['id'] in seen_ids:
+                continue
+            seen_ids.add(doc['id'])
+            yield doc
+
+
+def ordered_map(fn, items, workers):
+    """
+    Выполняет fn для элементов items в пуле потоков и отдает результаты в порядке items.
+    В работе одновременно держится не больше 2 * workers элементов, поэтому items может быть генератором.
+    """
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = deque()
+        for item in items:
+            in_flight.append(executor.submit(fn, item))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def extract_all(docs, concurrency=1):
+    """
+    Выполняет extract_data для документов параллельно, сохраняя порядок документов.
+    Отдает пары (документ из поиска, DataObject)
+    """
+    return ordered_map(lambda doc: (doc, extract_data(doc)), docs, concurrency)
 
 
 def is_valid_date(date_str, date_format="%Y-%m-%d"):
@@ -233,55 +492,443 @@ def is_valid_date(date_str, date_format="%Y-%m-%d"):
         return False
 
 
-def save_js_obj(obj):
-    if obj.__dict__ not in loaded_objects:
-        loaded_objects.append(obj.__dict__)
-
-
-def parse():
-    if not ARG_TYPE:
-        raise Exception('Не задан TYPE')
-    if not ARG_DATE_FROM:
-        raise Exception('Не задан DATE_FROM')
-    if ARG_TYPE not in ['GPZU', 'RNS']:
-        raise Exception(f'Неверный тип документа {ARG_TYPE} (допустимо GPZU, RNS)')
-    if ARG_DATE_FROM and not is_valid_date(ARG_DATE_FROM):
-        raise Exception(f'Неверный формат даты {ARG_DATE_FROM}')
-
-    type_ = {'GPZU': 'GPZU', 'RNS': 'RS'}[ARG_TYPE]
-    date_obj = datetime.strptime(ARG_DATE_FROM, '%Y-%m-%d') - timedelta(days=1)
+def save_js_obj(obj, writers, dedup=None):
+    """ Выводит запись, если такой еще не было. dedup - Deduplicator типа документов, по умолчанию общий """
+    if dedup is None:
+        dedup = deduplicator
+    with metrics.timer('output'):
+        save_record(obj.to_dict(), writers, dedup)
+
+
+def save_record(record, writers, dedup):
+    """ Выводит готовую запись (словарь DataObject.to_dict()), если такой еще не было """
+    if dedup.add(record):
+        for writer in writers:
+            writer.write(record)
+
+
+def parse_batch(value):
+    """
+    Разбирает список выгрузок BATCH: "GPZU:2024-01-01,RNS:2024-01-01:2024-06-30".
+    Возвращает список (тип, дата начала, дата окончания включительно или None). Без даты начала - DATE_FROM
+    """
+    batch = []
+    for item in (value or '').replace(' ', '').split(','):
+        if not item:
+            continue
+        parts = item.split(':')
+        if len(parts) > 3:
+            raise Exception(f'Неверный элемент BATCH {item} (ожидается ТИП[:ДАТА_НАЧАЛА[:ДАТА_ОКОНЧАНИЯ]])')
+        parts += [None] * (3 - len(parts))
+        batch.append((parts[0], parts[1] or ARG_DATE_FROM, parts[2] or None))
+    return batch
+
+
+def validate_run(doc_type, date_from, date_to):
+    if doc_type not in CHAPTER_CODES:
+        raise Exception(f'Неверный тип документа {doc_type} (допустимо GPZU, RNS)')
+    if not date_from:
+        raise Exception(f'Не задан DATE_FROM для {doc_type}')
+    if not is_valid_date(date_from):
+        raise Exception(f'Неверный формат даты {date_from}')
+    if date_to and not is_valid_date(date_to):
+        raise Exception(f'Неверный формат даты {date_to}')
+    if date_to and date_to < date_from:
+        raise Exception(f'Дата окончания {date_to} раньше даты начала {date_from}')
+
+
+def open_writers(doc_type, output, tep_export, append=False):
+    """ Вывод записей типа doc_type: файл или stdout, выгрузка ТЭП, база SQLite и индекс по кадастровым номерам """
+    writers = [open_writer(ARG_OUTPUT_FORMAT, output, append=append)]
+    if tep_export:
+        writers.append(TepExportWriter(tep_export))
+    if ARG_SQLITE_SINK:
+        writers.append(SqliteSink(ARG_SQLITE_SINK, doc_type))
+    if ARG_CAD_INDEX:
+        writers.append(CadIndexWriter(ARG_CAD_INDEX, doc_type, get_organisation_name=get_organisation_name))
+    return writers
+
+
+def search_bounds(date_from, date_to):
+    """
+    Границы поиска для выгрузки с date_from по date_to включительно: дата, после которой ищутся документы,
+    и дата, до которой (не включая) они ищутся, или None
+    """
+    date_obj = datetime.strptime(date_from, '%Y-%m-%d') - timedelta(days=1)
+    # Верхняя граница поиска не включается в выборку
+    search_to = (datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d') if date_to else None
+    return date_obj, search_to
+
+
+def search_documents(doc_type, date_, search_to=None):
+    """ Строки поиска документов типа doc_type одним поиском или по окнам SHARD """
+    type_ = CHAPTER_CODES[doc_type]
+    if ARG_SHARD:
+        return get_objects_sharded(type_, date_, ARG_PAGE_SIZE, ARG_SHARD, ARG_SHARD_WORKERS, search_to)
+    return get_objects(type_, date_, ARG_PAGE_SIZE, search_to)
+
+
+def run_type(doc_type, date_from, date_to=None, output=None, tep_export=None, dedup=None):
+    """
+    Выгружает документы одного типа в свой вывод. Авторизация, прокси, кэш карточек дел
+    и ограничение запросов общие для всех типов, поэтому несколько типов можно выгружать одновременно
+    :param doc_type: GPZU или RNS
+    :param date_from: дата документа, начиная с которой выполняется выгрузка
+    :param date_to: последняя дата документа включительно. Если None - без ограничения
+    :param dedup: Deduplicator для записей этого типа
+    """
+    date_obj, search_to = search_bounds(date_from, date_to)
+
+    checkpoint = None
+    if ARG_CHECKPOINT:
+        checkpoint = Checkpoint(ARG_CHECKPOINT, doc_type)
+        watermark = checkpoint.get_watermark()
+        # При обновлении просматривается весь интервал дат, а не только новые документы
+        if watermark and not ARG_REFRESH:
+            # Документы регистрируются с опозданием, поэтому берем несколько дней до watermark,
+            # уже обработанные документы будут пропущены
+            resume_from = datetime.strptime(watermark, '%Y-%m-%d') - timedelta(days=ARG_CHECKPOINT_OVERLAP_DAYS)
+            date_obj = max(date_obj, resume_from)
     date_ = date_obj.strftime('%Y-%m-%d')
 
-    def _do_parse():
-        cookies = get_cookies(EMAIL, PASSWORD, proxy)
-        set_cookies(cookies)
-        return get_objects(type_, date_)
-    all_data = _do_parse()
+    all_data = search_documents(doc_type, date_, search_to)
+    if ARG_REFRESH:
+        # Подробности запрашиваются только для новых документов и документов с изменившейся строкой поиска
+        all_data = (doc for doc in all_data if checkpoint.get_fingerprint(doc['id']) != row_fingerprint(doc))
+    elif checkpoint:
+        all_data = (doc for doc in all_data if not checkpoint.is_done(doc['id']))
 
-    for doc in all_data:
-        save_js_obj(extract_data(doc))
+    # При продолжении выгрузки дописываем в существующий файл
+    writers = open_writers(doc_type, output, tep_export, append=bool(checkpoint))
+    count = 0
+    try:
+        for i, (doc, obj) in enumerate(extract_all(all_data, ARG_CONCURRENCY), start=1):
+            save_js_obj(obj, writers, dedup)
+            metrics.add_documents()
+            count = i
+            if checkpoint:
+                checkpoint.mark_done(doc['id'], doc['dateOfDocument'], row_fingerprint(doc))
+            if i % ARG_FLUSH_EVERY == 0:
+                # С контрольной точкой записи должны попасть в вывод до отметки документов обработанными.
+                # Базы пишут пачками по числу записей, а после дедупликации записей меньше, чем документов
+                for writer in writers:
+                    writer.flush(force=bool(checkpoint))
+                # Сырые ответы сохраняются раньше контрольной точки, чтобы архив был полным для reextract.py
+                if archive is not None:
+                    archive.commit()
+                if checkpoint:
+                    checkpoint.commit()
+    finally:
+        for writer in writers:
+            writer.close()
+        if archive is not None:
+            archive.commit()
+        if checkpoint:
+            checkpoint.commit()
+    if checkpoint:
+        checkpoint.finish()
+        checkpoint.close()
+    logging.info('%s: обработано документов %s', doc_type, count)
+
+
+def run_coordinator(batch):
+    """
+    Координатор распределенной выгрузки: выполняет поиск и кладет документы в очередь QUEUE, ждет, пока их
+    обработают процессы MODE=worker, и выводит готовые записи каждого типа в порядке поиска
+    """
+    for doc_type, date_from, date_to in batch:
+        date_obj, search_to = search_bounds(date_from, date_to)
+        count = 0
+        chunk = []
+        for doc in search_documents(doc_type, date_obj.strftime('%Y-%m-%d'), search_to):
+            chunk.append(doc)
+            # Обработчики начинают работу, не дожидаясь конца поиска
+            if len(chunk) >= ARG_PAGE_SIZE:
+                work_queue.push(doc_type, chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            work_queue.push(doc_type, chunk)
+            count += len(chunk)
+        logging.info('%s: в очередь добавлено документов %s', doc_type, count)
+    work_queue.finish_search()
+
+    done = 0
+    while True:
+        counts = work_queue.counts()
+        metrics.add_documents(counts[DONE] - done)
+        done = counts[DONE]
+        if not counts[PENDING] and not counts[LEASED]:
+            break
+        time.sleep(ARG_QUEUE_POLL)
+
+    for doc_type, _, _ in batch:
+        output = ARG_OUTPUT.replace('{type}', doc_type) if ARG_OUTPUT else None
+        tep_export = ARG_TEP_EXPORT.replace('{type}', doc_type) if ARG_TEP_EXPORT else None
+        writers = open_writers(doc_type, output, tep_export)
+        dedup = Deduplicator(ARG_DEDUP_KEY)
+        count = 0
+        try:
+            for record in work_queue.iter_results(doc_type):
+                save_record(record, writers, dedup)
+                count += 1
+        finally:
+            for writer in writers:
+                writer.close()
+        logging.info('%s: выведено документов %s', doc_type, count)
+    if counts[FAILED]:
+        raise Exception(f'Не удалось обработать документов: {counts[FAILED]} (после {ARG_QUEUE_MAX_ATTEMPTS} попыток), '
+                        f'они не попали в вывод')
+
+
+def extract_task(task):
+    """ Обрабатывает документ из очереди. Возвращает (seq, запись) или (seq, None) при ошибке """
+    seq, doc = task
+    try:
+        return seq, extract_data(doc).to_dict()
+    except Exception:
+        logging.exception('Ошибка обработки документа %s', doc['id'])
+        return seq, None
+
+
+def run_worker():
+    """
+    Обработчик распределенной выгрузки: забирает документы из очереди QUEUE пачками с арендой и сохраняет
+    готовые записи туда же. Завершается, когда координатор закончил поиск и очередь опустела
+    """
+    count = 0
+    while True:
+        tasks = work_queue.claim(worker_id, ARG_QUEUE_BATCH)
+        if not tasks:
+            if work_queue.is_finished():
+                break
+            time.sleep(ARG_QUEUE_POLL)
+            continue
+        results = list(ordered_map(extract_task, tasks, ARG_CONCURRENCY))
+        # Сырые ответы сохраняются раньше отметки о выполнении, чтобы архив был полным для reextract.py
+        if archive is not None:
+            archive.commit()
+        work_queue.complete(worker_id, [(seq, record) for seq, record in results if record is not None])
+        failed = [seq for seq, record in results if record is None]
+        if failed:
+            work_queue.release(worker_id, failed)
+        metrics.add_documents(len(results) - len(failed))
+        count += len(results) - len(failed)
+    logging.info('Обработчик %s: обработано документов %s', worker_id, count)
 
-    print(json.dumps(loaded_objects, indent=4, ensure_ascii=False, sort_keys=False))
 
+def parse():
+    if ARG_MODE and ARG_MODE not in ['coordinator', 'worker']:
+        raise Exception(f'Неверный режим MODE {ARG_MODE} (допустимо coordinator, worker)')
+    if bool(ARG_MODE) != bool(ARG_QUEUE):
+        raise Exception('Распределенная выгрузка: MODE и QUEUE задаются вместе')
+    if ARG_MODE and ARG_CHECKPOINT:
+        raise Exception('CHECKPOINT не используется вместе с MODE: состояние выгрузки хранится в очереди QUEUE')
+    if ARG_MODE and ARG_ARCHIVE:
+        # Архив держит транзакцию записи между запросами к сайту: общий файл блокировал бы другие обработчики,
+        # а архив координатора без brief и карточек дел не годится для reextract.py
+        raise Exception('ARCHIVE не используется вместе с MODE')
+    if ARG_MODE == 'worker':
+        # Тип и даты задаются координатору
+        batch = []
+    elif ARG_BATCH:
+        batch = parse_batch(ARG_BATCH)
+        if not batch:
+            raise Exception('Пустой BATCH')
+        doc_types = [doc_type for doc_type, _, _ in batch]
+        if len(set(doc_types)) != len(doc_types):
+            raise Exception(f'Тип документа указан в BATCH несколько раз: {ARG_BATCH}')
+        # Каждый тип выводится в свой файл
+        if not ARG_OUTPUT or '{type}' not in ARG_OUTPUT:
+            raise Exception('Для BATCH задайте OUTPUT с шаблоном {type}, например out_{type}.ndjson')
+        if ARG_TEP_EXPORT and '{type}' not in ARG_TEP_EXPORT:
+            raise Exception('Для BATCH задайте TEP_EXPORT с шаблоном {type}')
+    else:
+        if not ARG_TYPE:
+            raise Exception('Не задан TYPE')
+        if not ARG_DATE_FROM:
+            raise Exception('Не задан DATE_FROM')
+        batch = [(ARG_TYPE, ARG_DATE_FROM, None)]
+    for doc_type, date_from, date_to in batch:
+        validate_run(doc_type, date_from, date_to)
+    if ARG_OUTPUT_FORMAT not in ['json', 'ndjson']:
+        raise Exception(f'Неверный формат вывода {ARG_OUTPUT_FORMAT} (допустимо json, ndjson)')
+    if not 1 <= ARG_PAGE_SIZE <= MAX_PAGE_SIZE:
+        raise Exception(f'Неверный размер страницы {ARG_PAGE_SIZE} (допустимо от 1 до {MAX_PAGE_SIZE})')
+    if ARG_SHARD and ARG_SHARD not in ['day', 'week', 'month']:
+        raise Exception(f'Неверный размер окна SHARD {ARG_SHARD} (допустимо day, week, month)')
+    if ARG_RETRY_ATTEMPTS < 1:
+        raise Exception(f'Неверное значение RETRY_ATTEMPTS {ARG_RETRY_ATTEMPTS} (должно быть >= 1)')
+    if ARG_REFRESH and not ARG_CHECKPOINT:
+        raise Exception('Для обновления (REFRESH) нужен CHECKPOINT с отпечатками прошлой выгрузки')
+    if ARG_CHECKPOINT and ARG_OUTPUT and ARG_OUTPUT_FORMAT != 'ndjson':
+        raise Exception('Для продолжения выгрузки в файл (CHECKPOINT) используйте OUTPUT_FORMAT=ndjson')
+    if ARG_CHECKPOINT and ARG_TEP_EXPORT:
+        # Файл Parquet/Arrow нельзя дописать, а без закрытия он не читается: после падения ТЭП документов,
+        # уже отмеченных в контрольной точке, были бы потеряны
+        raise Exception('TEP_EXPORT не используется вместе с CHECKPOINT')
+    if ARG_CONCURRENCY < 1:
+        raise Exception(f'Неверное значение CONCURRENCY {ARG_CONCURRENCY} (должно быть >= 1)')
+    if ARG_PROFILE and ARG_PROFILE not in ['cpu', 'memory']:
+        raise Exception(f'Неверный режим профилирования {ARG_PROFILE} (допустимо cpu, memory)')
+
+    try:
+        with profiling(ARG_PROFILE, ARG_PROFILE_FILE), ProgressReporter(metrics, ARG_PROGRESS_INTERVAL):
+            # Вход выполняется один раз для всех типов
+            for client in proxy_pool.clients:
+                login(client)
+            if ARG_MODE == 'coordinator':
+                run_coordinator(batch)
+            elif ARG_MODE == 'worker':
+                run_worker()
+            elif not ARG_BATCH:
+                run_type(ARG_TYPE, ARG_DATE_FROM, output=ARG_OUTPUT, tep_export=ARG_TEP_EXPORT)
+            else:
+                with ThreadPoolExecutor(max_workers=len(batch)) as executor:
+                    futures = []
+                    for doc_type, date_from, date_to in batch:
+                        tep_export = ARG_TEP_EXPORT.replace('{type}', doc_type) if ARG_TEP_EXPORT else None
+                        futures.append(executor.submit(
+                            run_type, doc_type, date_from, date_to, output=ARG_OUTPUT.replace('{type}', doc_type),
+                            tep_export=tep_export, dedup=Deduplicator(ARG_DEDUP_KEY)
+                        ))
+                    for future in futures:
+                        future.result()
+    finally:
+        metrics.log_summary()
+        if ARG_METRICS_FILE:
+            metrics.dump(ARG_METRICS_FILE)
+    logging.info('Кэш карточек дел: %s', case_cache.stats())
+    logging.info('Прокси: %s', proxy_pool.stats())
+    logging.info('Ограничение запросов: %s', limiter.stats())
 
-session = requests.Session()
 
 ARG_TYPE = os.getenv('ARG_TYPE')
 ARG_DATE_FROM = os.getenv('ARG_DATE_FROM', default=None)
+# Несколько типов за один запуск: "GPZU:2024-01-01,RNS:2024-01-01:2024-06-30" (тип, дата начала и окончания).
+# Типы выгружаются одновременно с общей авторизацией и кэшем, TYPE не используется
+ARG_BATCH = os.getenv('ARG_BATCH', default=None)
 ARG_PROXY = os.getenv('ARG_PROXY', default=None)
-
-loaded_objects = []
+# Список прокси через запятую, пробел или перевод строки. Запросы распределяются между ними
+ARG_PROXIES = os.getenv('ARG_PROXIES', default=None)
+# Файл со списком прокси, по одному на строку
+ARG_PROXIES_FILE = os.getenv('ARG_PROXIES_FILE', default=None)
+# Сколько ошибок подряд исключают прокси из ротации и на сколько секунд
+ARG_PROXY_MAX_ERRORS = int(os.getenv('ARG_PROXY_MAX_ERRORS', default=3))
+ARG_PROXY_COOLDOWN = int(os.getenv('ARG_PROXY_COOLDOWN', default=60))
+# Адрес API. Меняется только для запуска против локального стенда (benchmarks/stand_server.py)
+ARG_API_URL = os.getenv('ARG_API_URL', default='https://gisogd.mos.ru/isogd/front/api').rstrip('/')
+# Размер страницы поиска docsSearch (от 1 до MAX_PAGE_SIZE)
+ARG_PAGE_SIZE = int(os.getenv('ARG_PAGE_SIZE', default=100))
+# Разбиение поиска на окна по дате документа: day, week, month. Если не задано - один общий поиск
+ARG_SHARD = os.getenv('ARG_SHARD', default=None)
+# Сколько окон выгружается одновременно
+ARG_SHARD_WORKERS = int(os.getenv('ARG_SHARD_WORKERS', default=4))
+# Окно, в котором больше документов, делится пополам
+ARG_SHARD_MAX_TOTAL = int(os.getenv('ARG_SHARD_MAX_TOTAL', default=5000))
+# Сколько документов обрабатывается одновременно (запросы brief и карточек дел)
+ARG_CONCURRENCY = int(os.getenv('ARG_CONCURRENCY', default=8))
+# Повторы запросов при 429/5xx и обрывах: число попыток, начальная и максимальная задержка в секундах
+ARG_RETRY_ATTEMPTS = int(os.getenv('ARG_RETRY_ATTEMPTS', default=5))
+ARG_RETRY_BASE_DELAY = float(os.getenv('ARG_RETRY_BASE_DELAY', default=1.0))
+ARG_RETRY_MAX_DELAY = float(os.getenv('ARG_RETRY_MAX_DELAY', default=60.0))
+# Верхняя граница числа одновременных запросов к API. Фактический лимит подстраивается под ответы сервера
+ARG_MAX_REQUESTS = int(os.getenv('ARG_MAX_REQUESTS', default=(ARG_CONCURRENCY + ARG_SHARD_WORKERS + 1)
+                                                           * max(1, len(parse_batch(ARG_BATCH)))))
+# HTTP-клиент: requests или httpx (HTTP/2, нужен пакет httpx[http2])
+ARG_HTTP_BACKEND = os.getenv('ARG_HTTP_BACKEND', default='requests')
+# Таймауты запросов к API в секундах: установка соединения и ожидание ответа
+ARG_CONNECT_TIMEOUT = float(os.getenv('ARG_CONNECT_TIMEOUT', default=10))
+ARG_READ_TIMEOUT = float(os.getenv('ARG_READ_TIMEOUT', default=60))
+# Формат вывода: json - массив с отступами, ndjson - одна компактная запись на строку
+ARG_OUTPUT_FORMAT = os.getenv('ARG_OUTPUT_FORMAT', default='json')
+# Файл для вывода, по умолчанию stdout
+ARG_OUTPUT = os.getenv('ARG_OUTPUT', default=None)
+# Файл для колоночной выгрузки ТЭП (.parquet или .arrow), нужен pyarrow
+ARG_TEP_EXPORT = os.getenv('ARG_TEP_EXPORT', default=None)
+# Файл SQLite, в который дополнительно пишутся записи (документы, кадастровые номера, ТЭП)
+ARG_SQLITE_SINK = os.getenv('ARG_SQLITE_SINK', default=None)
+# Файл SQLite с обратным индексом кадастровый номер / номер дела -> документы (запросы через cad_index.py)
+ARG_CAD_INDEX = os.getenv('ARG_CAD_INDEX', default=None)
+# Через сколько записей сбрасывать вывод на диск
+ARG_FLUSH_EVERY = int(os.getenv('ARG_FLUSH_EVERY', default=100))
+# Ключ дедупликации записей: content - вся запись целиком, url - адрес документа
+ARG_DEDUP_KEY = os.getenv('ARG_DEDUP_KEY', default='content')
+# Файл SQLite с контрольной точкой: обработанные документы и дата последней успешной выгрузки
+ARG_CHECKPOINT = os.getenv('ARG_CHECKPOINT', default=None)
+# Обновление: просмотреть поиск с DATE_FROM и заново выгрузить только новые и изменившиеся документы
+# (по отпечатку строки поиска из CHECKPOINT)
+ARG_REFRESH = os.getenv('ARG_REFRESH', default='') not in ('', '0', 'false')
+# На сколько дней раньше watermark начинать следующую выгрузку
+ARG_CHECKPOINT_OVERLAP_DAYS = int(os.getenv('ARG_CHECKPOINT_OVERLAP_DAYS', default=7))
+# Файл для хранения cookies авторизации между запусками. По умолчанию - в директории профиля прокси
+ARG_COOKIES_FILE = os.getenv('ARG_COOKIES_FILE', default=None)
+# Адрес сервиса авторизации (login_service.py). Если задан, браузер парсером не запускается
+ARG_LOGIN_SERVICE = os.getenv('ARG_LOGIN_SERVICE', default=None)
+# Быстрый вход: eager-загрузка страниц, блокировка картинок, шрифтов, карт и счетчиков через CDP
+ARG_FAST_LOGIN = os.getenv('ARG_FAST_LOGIN', default='') not in ('', '0', 'false')
+# Запускать браузер для входа без окна
+ARG_HEADLESS = os.getenv('ARG_HEADLESS', default='') not in ('', '0', 'false')
+# Имя cookie авторизации: cookies забираются, как только она появилась, не дожидаясь интерфейса поиска
+ARG_AUTH_COOKIE = os.getenv('ARG_AUTH_COOKIE', default=None)
+# Кэш карточек дел: размер LRU в памяти, путь к файлу SQLite и время жизни записей в секундах
+ARG_CASE_CACHE_SIZE = int(os.getenv('ARG_CASE_CACHE_SIZE', default=50000))
+ARG_CASE_CACHE_PATH = os.getenv('ARG_CASE_CACHE_PATH', default=None)
+ARG_CASE_CACHE_TTL = int(os.getenv('ARG_CASE_CACHE_TTL', default=7 * 24 * 3600))
+ARG_CASE_CACHE_NEGATIVE_TTL = int(os.getenv('ARG_CASE_CACHE_NEGATIVE_TTL', default=600))
+# Файл SQLite для архива сырых ответов API (страницы поиска, brief, карточки дел), см. reextract.py
+ARG_ARCHIVE = os.getenv('ARG_ARCHIVE', default=None)
+# Распределенная выгрузка: coordinator - поиск и вывод, worker - обработка документов. Процессы связаны очередью QUEUE
+ARG_MODE = os.getenv('ARG_MODE', default=None)
+# Файл SQLite с очередью документов и общими cookies авторизации. Один на выгрузку
+ARG_QUEUE = os.getenv('ARG_QUEUE', default=None)
+# Сколько документов обработчик забирает за раз и на сколько секунд (потом их может забрать другой обработчик)
+ARG_QUEUE_BATCH = int(os.getenv('ARG_QUEUE_BATCH', default=50))
+ARG_QUEUE_LEASE = int(os.getenv('ARG_QUEUE_LEASE', default=300))
+# После скольких неудачных попыток документ исключается из выгрузки
+ARG_QUEUE_MAX_ATTEMPTS = int(os.getenv('ARG_QUEUE_MAX_ATTEMPTS', default=5))
+# Как часто проверять очередь, когда в ней нет работы, в секундах
+ARG_QUEUE_POLL = float(os.getenv('ARG_QUEUE_POLL', default=2))
+# Как часто писать в лог строку прогресса, в секундах. 0 - не писать
+ARG_PROGRESS_INTERVAL = float(os.getenv('ARG_PROGRESS_INTERVAL', default=30))
+# Файл для метрик этапов по завершении: .json - JSON, иначе текстовый формат Prometheus
+ARG_METRICS_FILE = os.getenv('ARG_METRICS_FILE', default=None)
+# Профилирование выгрузки: cpu - cProfile, memory - tracemalloc. Результат пишется в PROFILE_FILE
+ARG_PROFILE = os.getenv('ARG_PROFILE', default=None)
+ARG_PROFILE_FILE = os.getenv('ARG_PROFILE_FILE', default='parser.prof')
+
+deduplicator = Deduplicator(ARG_DEDUP_KEY)
+metrics = Metrics()
+retry_policy = RetryPolicy(max_attempts=ARG_RETRY_ATTEMPTS, base_delay=ARG_RETRY_BASE_DELAY,
+                           max_delay=ARG_RETRY_MAX_DELAY)
+limiter = AimdLimiter(initial=max(1, ARG_MAX_REQUESTS // 2), max_limit=ARG_MAX_REQUESTS)
+# С архивом кэш карточек дел только в памяти: каждая нужная карточка запрашивается и попадает в архив
+case_cache = CaseCardCache(max_size=ARG_CASE_CACHE_SIZE, path=None if ARG_ARCHIVE else ARG_CASE_CACHE_PATH,
+                           ttl=ARG_CASE_CACHE_TTL, negative_ttl=ARG_CASE_CACHE_NEGATIVE_TTL)
+archive = RawArchive(ARG_ARCHIVE) if ARG_ARCHIVE else None
 
 EMAIL = 'email'
 PASSWORD = 'password'
 
-proxy = None
-if ARG_PROXY:
-    proxy = ARG_PROXY
-    session.proxies = {
-        'http': ARG_PROXY,
-        'https': ARG_PROXY
-    }
+proxies = parse_proxies(ARG_PROXIES)
+if ARG_PROXIES_FILE:
+    with open(ARG_PROXIES_FILE, encoding='utf-8') as f:
+        proxies += parse_proxies(f.read())
+if ARG_PROXY and ARG_PROXY not in proxies:
+    proxies.insert(0, ARG_PROXY)
+
+proxy_pool = ProxyPool(proxies, cookies_file=ARG_COOKIES_FILE,
+                       max_errors=ARG_PROXY_MAX_ERRORS, cooldown=ARG_PROXY_COOLDOWN,
+                       session_factory=lambda proxy_url: make_session(proxy_url, pool_size=ARG_MAX_REQUESTS,
+                                                                      backend=ARG_HTTP_BACKEND))
+
+work_queue = WorkQueue(ARG_QUEUE, lease=ARG_QUEUE_LEASE, max_attempts=ARG_QUEUE_MAX_ATTEMPTS) if ARG_QUEUE else None
+worker_id = f'{socket.gethostname()}:{os.getpid()}'
+if work_queue is not None:
+    # Процессы распределенной выгрузки делят cookies через очередь: вход через браузер - один на прокси
+    for client in proxy_pool.clients:
+        client.cookie_store = QueueCookieStore(work_queue, client.proxy, worker_id)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
     parse()
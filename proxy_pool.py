@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+
+from cookie_store import CookieStore
+from transport import make_session
+from utils import Proxy, get_profile_dir
+
+
+class ProxyClient:
+    """
+    Прокси со своей session и cookies авторизации.
+    Хранит статистику запросов через прокси: среднюю задержку и ошибки подряд.
+    """
+
+    def __init__(self, proxy, cookies_file=None, session_factory=make_session):
+        self.proxy = proxy
+        self.session = session_factory(Proxy.from_str(proxy).to_url() if proxy else None)
+        self.cookie_store = CookieStore(cookies_file or os.path.join(get_profile_dir(proxy), 'gisogd_cookies.json'))
+        # Номер авторизации: увеличивается при каждом входе через браузер
+        self.auth_generation = 0
+        self.login_lock = threading.Lock()
+
+        self.latency = None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.disabled_until = 0.0
+
+    def score(self):
+        """ Ожидаемое время ответа с учетом уже выполняющихся запросов, меньше - лучше """
+        return (self.in_flight + 1) * (self.latency if self.latency is not None else 1.0)
+
+    def stats(self):
+        return {
+            'proxy': self.proxy,
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+            'disabled': self.disabled_until > time.monotonic(),
+        }
+
+
+class ProxyPool:
+    """
+    Набор прокси, между которыми распределяются запросы к API.
+    Запрос отдается прокси с наименьшей ожидаемой задержкой. Прокси с max_errors ошибками подряд
+    (ошибки соединения, 403, 429) исключается из ротации на cooldown секунд, если в ротации есть другие прокси.
+    """
+
+    def __init__(self, proxies, cookies_file=None, max_errors=3, cooldown=60, session_factory=make_session):
+        """
+        :param session_factory: функция, создающая session по адресу прокси (transport.make_session)
+        """
+        proxies = list(proxies) or [None]
+        self.clients = [ProxyClient(proxy, self._cookies_file(cookies_file, proxy, len(proxies)), session_factory)
+                        for proxy in proxies]
+        self.max_errors = max_errors
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cookies_file(cookies_file, proxy, count):
+        if not cookies_file or count == 1:
+            return cookies_file
+        # Для нескольких прокси у каждого свой файл рядом с заданным
+        root, ext = os.path.splitext(cookies_file)
+        return f'{root}_{os.path.basename(get_profile_dir(proxy))}{ext}'
+
+    def acquire(self):
+        """ Выбирает прокси для запроса. Если все прокси исключены, ждет ближайшего возвращения в ротацию """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                healthy = [c for c in self.clients if c.disabled_until <= now]
+                if healthy:
+                    client = min(healthy, key=ProxyClient.score)
+                    client.in_flight += 1
+                    return client
+                wait = min(c.disabled_until for c in self.clients) - now
+            time.sleep(max(wait, 0.1))
+
+    def release(self, client, latency, ok):
+        """ Учитывает результат запроса через прокси """
+        with self._lock:
+            client.in_flight -= 1
+            client.requests += 1
+            if client.latency is None:
+                client.latency = latency
+            else:
+                client.latency = 0.8 * client.latency + 0.2 * latency
+            if ok:
+                client.consecutive_errors = 0
+                return
+            client.errors += 1
+            client.consecutive_errors += 1
+            if client.consecutive_errors >= self.max_errors:
+                client.consecutive_errors = 0
+                now = time.monotonic()
+                # Последний прокси в ротации не исключается: иначе все запросы встанут на cooldown секунд
+                if any(c is not client and c.disabled_until <= now for c in self.clients):
+                    client.disabled_until = now + self.cooldown
+
+    def stats(self):
+        with self._lock:
+            return [client.stats() for client in self.clients]
+
+
+def parse_proxies(value):
+    """ Разбирает список прокси, разделенных запятыми, пробелами или переводами строк """
+    if not value:
+        return []
+    return [item for item in value.replace(',', ' ').split() if item]
@@ -0,0 +1,99 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# Ответы, после которых запрос повторяется: перегрузка и временные ошибки сервера
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def parse_retry_after(value):
+    """ Возвращает задержку из заголовка Retry-After в секундах (число или HTTP-дата) либо None """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """ Повтор запросов с экспоненциальной задержкой и случайным разбросом (full jitter) """
+
+    def __init__(self, max_attempts=5, base_delay=1.0, max_delay=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        """ Задержка перед повтором после попытки attempt (с 0). Retry-After сервера не сокращается """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class AimdLimiter:
+    """
+    Ограничение числа одновременных запросов по схеме AIMD: пока сервер отвечает нормально, лимит растет
+    на 1 за каждые limit успешных запросов; при 429/5xx и обрывах лимит уменьшается в decrease раз,
+    не чаще одного раза за cooldown секунд. Retry-After приостанавливает все новые запросы.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=32, decrease=0.5, cooldown=1.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.successes = 0
+        self.overloads = 0
+        self._last_decrease = 0.0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait()
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            self.successes += 1
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify()
+
+    def on_overload(self, retry_after=None):
+        with self._cond:
+            self.overloads += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self._last_decrease = now
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit': round(self.limit, 2),
+                'successes': self.successes,
+                'overloads': self.overloads,
+            }
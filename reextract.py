@@ -0,0 +1,97 @@
+"""
+Пересборка выгрузки из архива сырых ответов API (ARG_ARCHIVE) без запросов к сайту.
+Нужна после изменений в разборе документов: записи DataObject собираются заново тем же build_object,
+что и при обычной выгрузке, параллельно в нескольких процессах.
+
+Запуск: ARG_ARCHIVE=archive.db ARG_OUTPUT=out.ndjson ARG_OUTPUT_FORMAT=ndjson python reextract.py
+ARG_TYPE - только документы этого типа (по умолчанию все из архива).
+Формат вывода, TEP_EXPORT и ключ дедупликации задаются теми же переменными, что и для parser.py.
+"""
+import logging
+import os
+import time
+from multiprocessing import Pool
+
+from archive import RawArchive
+from output import open_writer
+from parser import (ARG_ARCHIVE, ARG_OUTPUT, ARG_OUTPUT_FORMAT, ARG_TEP_EXPORT, ARG_TYPE, CHAPTER_CODES,
+                    build_object, deduplicator, organisation_name_from_card)
+from tep_export import TepExportWriter
+
+# Сколько документов передается процессу за раз
+CHUNK_SIZE = 200
+
+_archive = None
+_organisation_names = {}
+
+
+def _init_worker(path):
+    global _archive
+    _archive = RawArchive(path, readonly=True)
+
+
+def _get_organisation_name(case_number):
+    if case_number not in _organisation_names:
+        card = _archive.get_card(case_number)
+        _organisation_names[case_number] = organisation_name_from_card(*card)[0] if card else None
+    return _organisation_names[case_number]
+
+
+def _rebuild(doc_ids):
+    """ Собирает записи для части документов. Возвращает (записи, число документов без brief в архиве) """
+    records = []
+    missing = 0
+    for data in _archive.get_search_rows(doc_ids):
+        brief = _archive.get_brief(data['id'])
+        if brief is None:
+            missing += 1
+            continue
+        records.append(build_object(data, brief, _get_organisation_name).to_dict())
+    return records, missing
+
+
+def reextract(path, type_=None, workers=None):
+    """
+    Пересобирает записи из архива в порядке получения документов и пишет их в вывод
+    :param type_: GPZU или RNS. Если None - все документы архива
+    :param workers: число процессов, по умолчанию по числу ядер
+    """
+    archive = RawArchive(path, readonly=True)
+    doc_ids = archive.get_doc_ids(CHAPTER_CODES[type_] if type_ else None)
+    archive.close()
+    chunks = [doc_ids[i:i + CHUNK_SIZE] for i in range(0, len(doc_ids), CHUNK_SIZE)]
+
+    writers = [open_writer(ARG_OUTPUT_FORMAT, ARG_OUTPUT)]
+    if ARG_TEP_EXPORT:
+        writers.append(TepExportWriter(ARG_TEP_EXPORT))
+    written = 0
+    missing = 0
+    start = time.perf_counter()
+    try:
+        with Pool(workers, initializer=_init_worker, initargs=(path,)) as pool:
+            for records, chunk_missing in pool.imap(_rebuild, chunks):
+                missing += chunk_missing
+                for record in records:
+                    if deduplicator.add(record):
+                        written += 1
+                        for writer in writers:
+                            writer.write(record)
+    finally:
+        for writer in writers:
+            writer.close()
+    logging.info('Пересобрано записей: %s из %s документов за %.1f с, без brief в архиве: %s',
+                 written, len(doc_ids), time.perf_counter() - start, missing)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if not ARG_ARCHIVE:
+        raise Exception('Не задан ARCHIVE')
+    if ARG_TYPE and ARG_TYPE not in CHAPTER_CODES:
+        raise Exception(f'Неверный тип документа {ARG_TYPE} (допустимо GPZU, RNS)')
+    workers = int(os.getenv('ARG_REEXTRACT_WORKERS', default=0)) or None
+    reextract(ARG_ARCHIVE, ARG_TYPE, workers)
+
+
+if __name__ == '__main__':
+    main()
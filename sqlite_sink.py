@@ -0,0 +1,102 @@
+"""
+Вывод записей в базу SQLite: таблица документов, кадастровые номера и ТЭП в отдельных таблицах.
+Записи пишутся пачками в одной транзакции, повторная выгрузка того же документа заменяет его данные (upsert).
+"""
+import json
+import sqlite3
+import time
+
+from tep_export import flatten_teps
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS documents ('
+    'doc_id TEXT PRIMARY KEY, type TEXT, number TEXT, date TEXT, zastroychik TEXT, address TEXT, '
+    'description TEXT, fno TEXT, url TEXT, record TEXT, updated_at REAL)',
+    'CREATE TABLE IF NOT EXISTS cad_numbers (doc_id TEXT, cad_number TEXT, PRIMARY KEY (doc_id, cad_number))',
+    'CREATE TABLE IF NOT EXISTS teps (doc_id TEXT, family TEXT, group_name TEXT, name TEXT, value TEXT)',
+    'CREATE INDEX IF NOT EXISTS documents_number ON documents (number)',
+    'CREATE INDEX IF NOT EXISTS documents_date ON documents (type, date)',
+    'CREATE INDEX IF NOT EXISTS documents_zastroychik ON documents (zastroychik)',
+    'CREATE INDEX IF NOT EXISTS cad_numbers_cad_number ON cad_numbers (cad_number)',
+    'CREATE INDEX IF NOT EXISTS teps_doc_id ON teps (doc_id)',
+    'CREATE INDEX IF NOT EXISTS teps_name_value ON teps (name, value)',
+)
+
+
+def doc_id_from_url(url):
+    """ id документа из адреса https://gisogd.mos.ru/document/{id} """
+    return url.rsplit('/', 1)[-1]
+
+
+class SqliteSink:
+    """ Пишет записи одного типа документов в SQLite пачками по batch_size. Неполная пачка пишется только в close() """
+
+    def __init__(self, path, doc_type, batch_size=500):
+        self.doc_type = doc_type
+        self.batch_size = batch_size
+        self._records = []
+        # Несколько типов пишут в одну базу из разных потоков: ждем освобождения блокировки, а не падаем
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._db:
+            for statement in SCHEMA:
+                self._db.execute(statement)
+
+    def write(self, record):
+        self._records.append(record)
+        if len(self._records) >= self.batch_size:
+            self._write_batch()
+
+    def flush(self, force=False):
+        """
+        Вызывается каждые FLUSH_EVERY записей: пачка меньше batch_size не пишется.
+        force - записать все накопленное, например перед сохранением контрольной точки
+        """
+        if force or len(self._records) >= self.batch_size:
+            self._write_batch()
+
+    def _write_batch(self):
+        if not self._records:
+            return
+        now = time.time()
+        documents = []
+        doc_ids = []
+        cad_numbers = []
+        teps = []
+        # Если документ попал в пачку несколько раз, остается последняя запись
+        latest = {doc_id_from_url(record['url']): record for record in self._records}
+        for doc_id, record in latest.items():
+            doc_ids.append((doc_id,))
+            documents.append((
+                doc_id, self.doc_type, record['number'], record['date'], record['zastroychik'], record['address'],
+                record['description'], record['fno'], record['url'],
+                json.dumps(record, ensure_ascii=False, separators=(',', ':')), now
+            ))
+            for cad_number in record['cad_numbers'] or ():
+                cad_numbers.append((doc_id, cad_number))
+            for _, _, _, family, group, name, value in flatten_teps(record):
+                teps.append((doc_id, family, group, name, None if value is None else str(value)))
+
+        with self._db:
+            self._db.executemany(
+                'INSERT INTO documents (doc_id, type, number, date, zastroychik, address, description, fno, url, '
+                'record, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(doc_id) DO UPDATE SET type = excluded.type, number = excluded.number, '
+                'date = excluded.date, zastroychik = excluded.zastroychik, address = excluded.address, '
+                'description = excluded.description, fno = excluded.fno, url = excluded.url, '
+                'record = excluded.record, updated_at = excluded.updated_at',
+                documents
+            )
+            # Дочерние строки документа заменяются целиком
+            self._db.executemany('DELETE FROM cad_numbers WHERE doc_id = ?', doc_ids)
+            self._db.executemany('DELETE FROM teps WHERE doc_id = ?', doc_ids)
+            self._db.executemany('INSERT OR IGNORE INTO cad_numbers (doc_id, cad_number) VALUES (?, ?)',
+                                 cad_numbers)
+            self._db.executemany('INSERT INTO teps (doc_id, family, group_name, name, value) VALUES (?, ?, ?, ?, ?)',
+                                 teps)
+        self._records = []
+
+    def close(self):
+        self._write_batch()
+        self._db.close()
@@ -0,0 +1,102 @@
+"""
+Разбор customAttributes из /documents/{id}/brief.
+Значения атрибутов ТЭП - это JSON-строки внутри JSON, иногда с еще одним уровнем вложенности,
+поэтому для разбора используется самая быстрая из установленных библиотек: orjson, msgspec или json.
+"""
+import json
+
+try:
+    import orjson
+    _fast_loads = orjson.loads
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    try:
+        import msgspec
+        _fast_loads = msgspec.json.decode
+        JSON_BACKEND = 'msgspec'
+    except ImportError:
+        _fast_loads = json.loads
+        JSON_BACKEND = 'json'
+
+if JSON_BACKEND == 'msgspec':
+    _FAST_ERRORS = (ValueError, msgspec.DecodeError)
+else:
+    _FAST_ERRORS = (ValueError,)
+
+
+def _loads_with_fallback(text):
+    """ json.loads на быстрой библиотеке. То, что она не принимает (например NaN), разбирается через json """
+    try:
+        return _fast_loads(text)
+    except _FAST_ERRORS:
+        return json.loads(text)
+
+
+loads = json.loads if JSON_BACKEND == 'json' else _loads_with_fallback
+
+
+# Семейства атрибутов ТЭП. Атрибут относится к первому семейству, подстрока которого есть в его коде.
+# (подстрока кода, поле DataObject, вид, подстрока кода имени группы, ключ пары "значение - название")
+# list - список пар [название, значение]; groups - список групп с именем группы и списком пар.
+# Если в первом элементе пары есть ключ из последнего столбца, элементы пары поменяны местами.
+ATTRIBUTE_FAMILIES = (
+    ('tepList', 'teps', 'list', None, 'tepListTepName'),
+    ('dopTepList', 'additional_teps', 'list', None, 'tepListTepName'),
+    ('tepGroups', 'tep_groups', 'groups', 'tepGroupsGroupName', 'tepGroupsTepListTepValue'),
+    ('dopTepGroups', 'additional_teps_groups', 'groups', 'dopTepGroupsGroupName', 'dopTepGroupsTepListTepName'),
+)
+
+
+def _decode_list(value, swap_key):
+    teps = {}
+    for element in loads(value):
+        if len(element) != 2:
+            continue
+        name, value_ = element
+        if swap_key in name:
+            teps[value_['value']] = name['value']
+        else:
+            teps[name['value']] = value_['value']
+    return teps
+
+
+def _decode_groups(value, group_name_code, swap_key):
+    tep_groups = {}
+    # Имя группы переходит к следующим группам, если у них нет своего
+    group_name = None
+    for group in loads(value):
+        for det in group:
+            if group_name_code in det['code']:
+                group_name = det['value']
+            else:
+                group_det = {}
+                for tep in loads(det['value']):
+                    name, value_ = tep
+                    if swap_key in name:
+                        group_det[value_['value']] = name['value']
+                    else:
+                        group_det[name['value']] = value_['value']
+                tep_groups[group_name] = group_det
+    return tep_groups
+
+
+def decode_custom_attributes(custom_attributes):
+    """
+    Разбирает customAttributes за один проход по атрибутам
+    :param custom_attributes: JSON-строка customAttributes
+    :return: (словарь поле DataObject -> ТЭП, прочие атрибуты {name: value})
+    """
+    fields = {}
+    details = {}
+    for attr in loads(custom_attributes):
+        code = attr['code']
+        for code_part, field, kind, group_name_code, swap_key in ATTRIBUTE_FAMILIES:
+            if code_part in code:
+                if kind == 'list':
+                    fields[field] = _decode_list(attr['value'], swap_key)
+                else:
+                    fields[field] = _decode_groups(attr['value'], group_name_code, swap_key)
+                break
+        else:
+            details[attr['name']] = attr['value']
+    return fields, details
@@ -0,0 +1,73 @@
+"""
+Колоночная выгрузка ТЭП: по строке на каждую пару название - значение ТЭП документа.
+Пишет Parquet (.parquet) или Arrow IPC (.arrow, .feather), нужен пакет pyarrow.
+"""
+import os
+
+# Поля записи с ТЭП: без групп и с группами
+TEP_FIELDS = ('teps', 'additional_teps')
+TEP_GROUP_FIELDS = ('tep_groups', 'additional_teps_groups')
+
+COLUMNS = ('url', 'number', 'date', 'family', 'group', 'name', 'value')
+
+
+def flatten_teps(record):
+    """ Возвращает строки (url, number, date, family, group, name, value) для всех ТЭП записи """
+    head = (record['url'], record['number'], record['date'])
+    for family in TEP_FIELDS:
+        for name, value in (record.get(family) or {}).items():
+            yield head + (family, None, name, value)
+    for family in TEP_GROUP_FIELDS:
+        for group, teps in (record.get(family) or {}).items():
+            for name, value in teps.items():
+                yield head + (family, group, name, value)
+
+
+class TepExportWriter:
+    """
+    Копит строки ТЭП и пишет их в файл пачками по batch_size: одна пачка - одна группа строк Parquet
+    (или пачка Arrow). Неполная пачка пишется только в close()
+    """
+
+    def __init__(self, path, batch_size=50000):
+        try:
+            import pyarrow
+        except ImportError:
+            raise Exception('Для выгрузки ТЭП (TEP_EXPORT) нужен пакет pyarrow')
+        self._pa = pyarrow
+        self.path = path
+        self.batch_size = batch_size
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in COLUMNS])
+        self._columns = {column: [] for column in COLUMNS}
+        self._rows = 0
+        if os.path.splitext(path)[1] in ('.arrow', '.feather'):
+            import pyarrow.ipc
+            self._writer = pyarrow.ipc.new_file(path, self.schema)
+        else:
+            import pyarrow.parquet
+            self._writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, record):
+        for row in flatten_teps(record):
+            for column, value in zip(COLUMNS, row):
+                self._columns[column].append(None if value is None else str(value))
+            self._rows += 1
+        if self._rows >= self.batch_size:
+            self._write_batch()
+
+    def flush(self, force=False):
+        # Вывод сбрасывается каждые FLUSH_EVERY записей, а мелкие группы строк замедляют чтение Parquet
+        if force or self._rows >= self.batch_size:
+            self._write_batch()
+
+    def _write_batch(self):
+        if not self._rows:
+            return
+        table = self._pa.table(self._columns, schema=self.schema)
+        self._writer.write_table(table)
+        self._columns = {column: [] for column in COLUMNS}
+        self._rows = 0
+
+    def close(self):
+        self._write_batch()
+        self._writer.close()
@@ -0,0 +1,113 @@
+"""
+HTTP-клиенты для запросов к API: requests с настроенным пулом keep-alive соединений
+или httpx с поддержкой HTTP/2 (если установлен).
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import brotli  # noqa: F401
+    HAS_BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        HAS_BROTLI = True
+    except ImportError:
+        HAS_BROTLI = False
+
+# Ошибки соединения, после которых запрос можно повторить
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout)
+if httpx is not None:
+    TRANSIENT_ERRORS += (httpx.TransportError,)
+
+# urllib3 и httpx сами распаковывают br, если установлен brotli
+ACCEPT_ENCODING = 'gzip, deflate, br' if HAS_BROTLI else 'gzip, deflate'
+
+
+def make_session(proxy_url=None, pool_size=10, backend='requests'):
+    """
+    Создает session для запросов к API
+    :param proxy_url: адрес прокси (Proxy.to_url()) или None
+    :param pool_size: сколько keep-alive соединений держать, должно быть не меньше числа одновременных запросов
+    :param backend: requests или httpx (HTTP/2)
+    """
+    if backend == 'httpx':
+        return HttpxSession(proxy_url, pool_size)
+    if backend != 'requests':
+        raise Exception(f'Неверный HTTP-клиент {backend} (допустимо requests, httpx)')
+
+    session = requests.Session()
+    # pool_block - лишние запросы ждут свободное соединение, а не открывают новое, которое сразу закроется
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'Accept-Encoding': ACCEPT_ENCODING,
+        'Connection': 'keep-alive',
+    })
+    if proxy_url:
+        session.proxies = {
+            'http': proxy_url,
+            'https': proxy_url
+        }
+    return session
+
+
+class HttpxSession:
+    """ Обертка над httpx.Client с интерфейсом requests.Session, который использует парсер """
+
+    def __init__(self, proxy_url=None, pool_size=10):
+        if httpx is None:
+            raise Exception('Для HTTP_BACKEND=httpx нужен пакет httpx[http2]')
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.client = httpx.Client(http2=True, proxy=proxy_url, limits=limits,
+                                   headers={'Accept-Encoding': ACCEPT_ENCODING})
+        self.cookies = _HttpxCookies(self.client.cookies)
+
+    def request(self, method, url, timeout=None, **kwargs):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = httpx.Timeout(read, connect=connect)
+        return _HttpxResponse(self.client.request(method, url, timeout=timeout, **kwargs))
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.client.close()
+
+
+class _HttpxCookies:
+    def __init__(self, cookies):
+        self._cookies = cookies
+
+    def set(self, name, value, domain='', path='/', **kwargs):
+        # httpx не хранит secure и expires, cookies из браузера используются только в пределах запуска
+        self._cookies.set(name, value, domain=domain, path=path)
+
+    def clear(self):
+        self._cookies.clear()
+
+
+class _HttpxResponse:
+    """ Ответ httpx, который можно использовать в with, как ответ requests """
+
+    def __init__(self, response):
+        self._response = response
+
+    def __getattr__(self, item):
+        return getattr(self._response, item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._response.close()
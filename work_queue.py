@@ -0,0 +1,208 @@
+"""
+Очередь документов для распределенной выгрузки (ARG_MODE=coordinator|worker) в SQLite.
+Координатор выполняет поиск и кладет строки поиска в очередь, обработчики забирают их пачками с арендой
+на lease секунд и возвращают готовые записи. Пачка обработчика, который упал, после окончания аренды
+достается другому. В той же базе хранятся общие cookies авторизации по прокси, чтобы вход через браузер
+выполнялся один раз на прокси, а не в каждом процессе.
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class WorkQueue:
+    """ Очередь с арендой пачек. Один объект можно использовать из нескольких потоков """
+
+    def __init__(self, path, lease=300, max_attempts=5):
+        """
+        :param lease: на сколько секунд обработчик получает пачку
+        :param max_attempts: после скольких неудачных попыток документ считается ошибочным
+        """
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Транзакции открываются явно: BEGIN IMMEDIATE сразу берет блокировку записи, чтобы два процесса
+        # не выдали одну и ту же пачку
+        self._db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS tasks (seq INTEGER PRIMARY KEY, type TEXT, doc_id TEXT, row TEXT, '
+            'state TEXT, owner TEXT, lease_until REAL, attempts INTEGER DEFAULT 0, UNIQUE (type, doc_id))'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_until)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS results (seq INTEGER PRIMARY KEY, record TEXT)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS cookies '
+            '(proxy TEXT PRIMARY KEY, cookies TEXT, owner TEXT, lease_until REAL)'
+        )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def push(self, type_, rows):
+        """ Добавляет строки поиска документов типа type_. Документы, которые уже есть в очереди, пропускаются """
+        with self._transaction() as db:
+            db.executemany(
+                'INSERT OR IGNORE INTO tasks (type, doc_id, row, state) VALUES (?, ?, ?, ?)',
+                [(type_, str(row['id']), json.dumps(row, ensure_ascii=False), PENDING) for row in rows]
+            )
+
+    def finish_search(self):
+        """ Отмечает, что координатор выложил все документы """
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO state (name, value) VALUES ('search_finished', '1')")
+
+    def claim(self, owner, size):
+        """ Выдает обработчику owner до size документов: новых или с истекшей арендой. Возвращает [(seq, строка)] """
+        now = time.time()
+        with self._transaction() as db:
+            # Истекшая аренда - неудачная попытка: документ, который роняет или вешает обработчик,
+            # не должен выдаваться бесконечно
+            db.execute(
+                'UPDATE tasks SET attempts = attempts + 1, owner = NULL, lease_until = NULL, '
+                'state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END WHERE state = ? AND lease_until < ?',
+                (self.max_attempts, FAILED, PENDING, LEASED, now)
+            )
+            rows = db.execute(
+                'SELECT seq, row FROM tasks WHERE state = ? ORDER BY seq LIMIT ?', (PENDING, size)
+            ).fetchall()
+            db.executemany('UPDATE tasks SET state = ?, owner = ?, lease_until = ? WHERE seq = ?',
+                           [(LEASED, owner, now + self.lease, seq) for seq, _ in rows])
+        return [(seq, json.loads(row)) for seq, row in rows]
+
+    def complete(self, owner, results):
+        """
+        Сохраняет готовые записи [(seq, запись)] и отмечает документы выполненными.
+        Если аренда уже перешла к другому обработчику, запись все равно сохраняется - она та же самая
+        """
+        if not results:
+            return
+        with self._transaction() as db:
+            db.executemany('INSERT OR REPLACE INTO results (seq, record) VALUES (?, ?)',
+                           [(seq, json.dumps(record, ensure_ascii=False)) for seq, record in results])
+            db.executemany('UPDATE tasks SET state = ?, owner = ?, lease_until = NULL WHERE seq = ?',
+                           [(DONE, owner, seq) for seq, _ in results])
+
+    def release(self, owner, seqs):
+        """ Возвращает документы в очередь после ошибки. После max_attempts попыток документ считается ошибочным """
+        with self._transaction() as db:
+            db.executemany(
+                'UPDATE tasks SET attempts = attempts + 1, owner = NULL, lease_until = NULL, '
+                'state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END WHERE seq = ? AND owner = ?',
+                [(self.max_attempts, FAILED, PENDING, seq, owner) for seq in seqs]
+            )
+
+    def counts(self):
+        """ Число документов по состояниям """
+        with self._lock:
+            rows = self._db.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(rows)
+        return counts
+
+    def is_finished(self):
+        """ Поиск закончен и все документы обработаны или признаны ошибочными """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE name = 'search_finished'").fetchone()
+        if not row:
+            return False
+        counts = self.counts()
+        return not counts[PENDING] and not counts[LEASED]
+
+    def iter_results(self, type_, chunk_size=1000):
+        """ Готовые записи документов типа type_ в порядке поиска """
+        last_seq = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    'SELECT t.seq, r.record FROM tasks t JOIN results r ON r.seq = t.seq '
+                    'WHERE t.type = ? AND t.seq > ? ORDER BY t.seq LIMIT ?', (type_, last_seq, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            for seq, record in rows:
+                yield json.loads(record)
+            last_seq = rows[-1][0]
+
+    def get_cookies(self, proxy):
+        with self._lock:
+            row = self._db.execute('SELECT cookies FROM cookies WHERE proxy = ?', (proxy or '',)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def save_cookies(self, proxy, cookies):
+        with self._transaction() as db:
+            db.execute(
+                'INSERT INTO cookies (proxy, cookies) VALUES (?, ?) '
+                'ON CONFLICT(proxy) DO UPDATE SET cookies = excluded.cookies',
+                (proxy or '', json.dumps(cookies) if cookies is not None else None)
+            )
+
+    @contextmanager
+    def login_lease(self, proxy, owner, lease=300, poll=1.0):
+        """ Межпроцессная блокировка входа через браузер для прокси. Блокировка упавшего процесса истекает """
+        while True:
+            now = time.time()
+            with self._transaction() as db:
+                row = db.execute('SELECT owner, lease_until FROM cookies WHERE proxy = ?', (proxy or '',)).fetchone()
+                if row is None or row[0] is None or row[0] == owner or (row[1] or 0) < now:
+                    db.execute(
+                        'INSERT INTO cookies (proxy, owner, lease_until) VALUES (?, ?, ?) '
+                        'ON CONFLICT(proxy) DO UPDATE SET owner = excluded.owner, lease_until = excluded.lease_until',
+                        (proxy or '', owner, now + lease)
+                    )
+                    break
+            time.sleep(poll)
+        try:
+            yield
+        finally:
+            with self._transaction() as db:
+                db.execute('UPDATE cookies SET owner = NULL, lease_until = NULL WHERE proxy = ? AND owner = ?',
+                           (proxy or '', owner))
+
+    def close(self):
+        self._db.close()
+
+
+class QueueCookieStore:
+    """
+    Хранилище cookies прокси в очереди, общее для всех процессов выгрузки (интерфейс cookie_store.CookieStore).
+    Вход через браузер выполняется под login_lock(), поэтому для прокси его выполняет только один процесс
+    """
+
+    shared = True
+
+    def __init__(self, queue, proxy, owner):
+        self.queue = queue
+        self.proxy = proxy
+        self.owner = owner
+        self.path = f'{queue.path} ({proxy or "без прокси"})'
+
+    def load(self):
+        return self.queue.get_cookies(self.proxy)
+
+    def save(self, cookies):
+        self.queue.save_cookies(self.proxy, cookies)
+
+    def clear(self):
+        self.queue.save_cookies(self.proxy, None)
+
+    def login_lock(self):
+        return self.queue.login_lease(self.proxy, self.owner)